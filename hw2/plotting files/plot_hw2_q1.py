@@ -1,7 +1,7 @@
 import os
 import pandas as pd
 import matplotlib.pyplot as plt
-from tensorboard.backend.event_processing.event_accumulator import EventAccumulator
+from rob831.infrastructure.tb_reader import read_scalars
 
 # --- CONFIGURATION ---
 LOG_DIR = 'data'
@@ -13,34 +13,25 @@ def load_tfevents_data(log_dir_path):
     Reads all scalar events from a TensorBoard log directory.
     Returns a DataFrame containing the 'Eval_AverageReturn' vs. 'Iteration'.
     """
-    event_file = None
-    # Find the .tfevents file inside the directory
-    for f in os.listdir(log_dir_path):
-        if f.startswith('events.out.tfevents'):
-            event_file = os.path.join(log_dir_path, f)
-            break
-    
-    if not event_file:
+    if not any(f.startswith('events.out.tfevents') for f in os.listdir(log_dir_path)):
         print(f"No .tfevents file found in {log_dir_path}. Skipping.")
         return None
 
-    # Use EventAccumulator to load the TensorBoard events
-    event_acc = EventAccumulator(event_file)
-    event_acc.Reload()
-
+    # Read the scalars of the TensorBoard event files
     # The tag we are interested in is 'Eval_AverageReturn'
     tag = 'Eval_AverageReturn'
-    if tag not in event_acc.Tags()['scalars']:
-        print(f"Tag '{tag}' not found in {event_file}. Skipping.")
+    scalars = read_scalars(log_dir_path, tags=[tag])
+    if tag not in scalars:
+        print(f"Tag '{tag}' not found in {log_dir_path}. Skipping.")
         return None
     
     # Extract data
-    scalar_events = event_acc.Scalars(tag)
+    steps, values = scalars[tag]
     
     # Create DataFrame: step is the iteration number, value is the return
     data = {
-        'Iteration': [event.step for event in scalar_events],
-        'Eval_AverageReturn': [event.value for event in scalar_events]
+        'Iteration': steps,
+        'Eval_AverageReturn': values
     }
     
     return pd.DataFrame(data)
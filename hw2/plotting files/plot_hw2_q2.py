@@ -1,7 +1,7 @@
 import os
 import pandas as pd
 import matplotlib.pyplot as plt
-from tensorboard.backend.event_processing.event_accumulator import EventAccumulator
+from rob831.infrastructure.tb_reader import read_scalars
 
 # --- CONFIGURATION ---
 LOG_DIR = 'data'   # Put your q2 folders inside here
@@ -14,31 +14,21 @@ TARGET_PREFIX = 'q2_'   # only look at q2 runs
 
 def load_tfevents_data(log_dir_path):
     """Load Eval_AverageReturn data from TensorBoard tfevents file."""
-    event_file = None
-    for f in os.listdir(log_dir_path):
-        if f.startswith('events.out.tfevents'):
-            event_file = os.path.join(log_dir_path, f)
-            break
-
-    if not event_file:
-        return None
-
+    tag = 'Eval_AverageReturn'
     try:
-        event_acc = EventAccumulator(event_file)
-        event_acc.Reload()
+        scalars = read_scalars(log_dir_path, tags=[tag])
     except Exception as e:
         print(f"Error loading {log_dir_path}: {e}")
         return None
 
-    tag = 'Eval_AverageReturn'
-    if tag not in event_acc.Tags()['scalars']:
+    if tag not in scalars:
         return None
 
-    scalar_events = event_acc.Scalars(tag)
+    steps, values = scalars[tag]
 
     df = pd.DataFrame({
-        'Iteration': [event.step for event in scalar_events],
-        'Value': [event.value for event in scalar_events]
+        'Iteration': steps,
+        'Value': values
     })
 
     clean_df = df.groupby('Iteration')['Value'].mean().reset_index()
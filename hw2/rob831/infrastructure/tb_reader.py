@@ -0,0 +1,213 @@
+import glob
+import mmap
+import os
+import struct
+
+import numpy as np
+
+# Reads the scalars of tensorboard event files without TensorFlow. An event
+# file is a sequence of TFRecords (uint64 length, uint32 crc, data, uint32 crc)
+# whose data is a serialized Event proto; only the fields needed to get at the
+# scalar summary values are decoded.
+#
+# hw2, hw3 and hw4 each install their own `rob831` package, and only one of them
+# can be installed at a time, so each homework ships a copy of this module
+# (hw2 and hw3: rob831/infrastructure/tb_reader.py, hw4: rob831/tb_reader.py).
+# The copies must stay identical, so that all the homeworks read event files,
+# and the caches next to them, the same way.
+
+# each event file gets its own cache next to it, so reading one file and reading
+# its whole run directory share the caches instead of overwriting each other
+CACHE_SUFFIX = '.scalars.npz'
+
+
+def _read_varint(buf, pos):
+    result, shift = 0, 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(buf, pos, end):
+    """
+        Yields (field number, wire type, value) for the protobuf message in buf[pos:end].
+        Length-delimited values are yielded as (start, stop) offsets into buf, so
+        payloads that are not needed are skipped without being read.
+    """
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire == 2:
+            length, pos = _read_varint(buf, pos)
+            value, pos = (pos, pos + length), pos + length
+        elif wire == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            raise ValueError('unsupported protobuf wire type {}'.format(wire))
+        yield field, wire, value
+
+
+def _tensor_scalar(buf, start, end):
+    """The value of a float or double scalar TensorProto, else None."""
+    dtype, value, content = None, None, None
+    for field, wire, data in _fields(buf, start, end):
+        if field == 1:
+            dtype = data
+        elif field == 4:
+            content = buf[data[0]:data[1]]
+        elif field == 5 and (wire == 5 or data[1] - data[0] == 4):
+            value = struct.unpack('<f', data if wire == 5 else buf[data[0]:data[1]])[0]
+        elif field == 6 and (wire == 1 or data[1] - data[0] == 8):
+            value = struct.unpack('<d', data if wire == 1 else buf[data[0]:data[1]])[0]
+    if value is None and content is not None:
+        if dtype == 1 and len(content) == 4:  # DT_FLOAT
+            value = struct.unpack('<f', content)[0]
+        elif dtype == 2 and len(content) == 8:  # DT_DOUBLE
+            value = struct.unpack('<d', content)[0]
+    return value
+
+
+def _summary_scalars(buf, start, end):
+    """Yields (tag, value) for the scalar values of the Summary in buf[start:end]."""
+    for field, _, (value_start, value_end) in _fields(buf, start, end):
+        if field != 1:
+            continue
+        tag, value = None, None
+        for value_field, _, data in _fields(buf, value_start, value_end):
+            if value_field == 1:
+                tag = buf[data[0]:data[1]].decode('utf-8')
+            elif value_field == 2:  # simple_value
+                value = struct.unpack('<f', data)[0]
+            elif value_field == 8:  # tensor
+                value = _tensor_scalar(buf, *data)
+            # image, histogram and audio payloads (videos are images) are skipped
+        if tag is not None and value is not None:
+            yield tag, value
+
+
+def _read_event_file(path):
+    """
+        Reads every scalar of an event file
+        returns:
+            {tag: (steps, values, records)}, where records are the indices of the
+            events that logged the values, and the number of events in the file
+    """
+    if os.path.getsize(path) == 0:
+        return {}, 0
+    series, record = {}, 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        pos, size = 0, len(buf)
+        while pos + 12 <= size:
+            length, = struct.unpack_from('<Q', buf, pos)
+            start, end = pos + 12, pos + 12 + length
+            if end + 4 > size:
+                break  # the last record is still being written
+            pos = end + 4
+
+            step, summary = 0, None
+            for field, _, value in _fields(buf, start, end):
+                if field == 2:
+                    step = value - (1 << 64) if value >> 63 else value  # int64
+                elif field == 5:
+                    summary = value
+            if summary is not None:
+                for tag, value in _summary_scalars(buf, *summary):
+                    steps, values, records = series.setdefault(tag, ([], [], []))
+                    steps.append(step)
+                    values.append(value)
+                    records.append(record)
+            record += 1
+    scalars = {tag: (np.array(steps, dtype=np.int64), np.array(values, dtype=np.float64),
+                     np.array(records, dtype=np.int64))
+               for tag, (steps, values, records) in series.items()}
+    return scalars, record
+
+
+def _cache_path(path):
+    return os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + CACHE_SUFFIX)
+
+
+def _load_cache(cache_path, signature):
+    try:
+        with np.load(cache_path) as cache:
+            if str(cache['signature']) != signature:
+                return None
+            tags, offsets = cache['tags'], cache['offsets']
+            steps, values, records = cache['steps'], cache['values'], cache['records']
+            num_records = int(cache['num_records'])
+    except (OSError, KeyError, ValueError):
+        return None
+    scalars = {str(tag): tuple(a[offsets[i]:offsets[i + 1]] for a in (steps, values, records))
+               for i, tag in enumerate(tags)}
+    return scalars, num_records
+
+
+def _save_cache(cache_path, signature, scalars, num_records):
+    tags = sorted(scalars)
+    offsets = np.cumsum([0] + [len(scalars[tag][0]) for tag in tags])
+    try:
+        # write to a temporary file first so concurrent readers never see a partial cache
+        tmp_path = '{}.{}.npz'.format(cache_path[:-len('.npz')], os.getpid())
+        np.savez(tmp_path, signature=signature, tags=np.array(tags, dtype=str), offsets=offsets,
+                 num_records=num_records,
+                 steps=np.concatenate([scalars[tag][0] for tag in tags] or [np.zeros(0, np.int64)]),
+                 values=np.concatenate([scalars[tag][1] for tag in tags] or [np.zeros(0)]),
+                 records=np.concatenate([scalars[tag][2] for tag in tags] or [np.zeros(0, np.int64)]))
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # the cache is an optimization only
+
+
+def _read_cached(path, use_cache):
+    stat = os.stat(path)
+    signature = '{}:{}'.format(stat.st_size, stat.st_mtime_ns)
+    cache_path = _cache_path(path)
+    cached = _load_cache(cache_path, signature) if use_cache else None
+    if cached is None:
+        cached = _read_event_file(path)
+        if use_cache:
+            _save_cache(cache_path, signature, *cached)
+    return cached
+
+
+def read_scalars(path, tags=None, use_cache=True, return_records=False):
+    """
+        Reads scalar series from tensorboard event files, without TensorFlow
+        arguments:
+            path: a run directory (all of its event files, in name order) or one event file
+            tags: the scalar tags to return, or None for all of them
+            use_cache: keep the series of all scalar tags of each event file in a
+                hidden file next to it, keyed by the size and mtime of the event file
+            return_records: also return the index of the event that logged each
+                value, counted over the files read, to compare the order of tags
+        returns:
+            {tag: (steps, values)}, as numpy arrays in the order they were logged,
+            or {tag: (steps, values, records)} if return_records
+    """
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, 'events.out.tfevents*')))
+    else:
+        files = [path]
+
+    series, offset = {}, 0
+    for f in files:
+        file_scalars, num_records = _read_cached(f, use_cache)
+        for tag, (steps, values, records) in file_scalars.items():
+            series.setdefault(tag, []).append((steps, values, records + offset))
+        offset += num_records
+    scalars = {tag: tuple(np.concatenate(arrays) for arrays in zip(*parts))
+               for tag, parts in series.items() if tags is None or tag in tags}
+
+    if tags is not None:
+        scalars = {tag: scalars[tag] for tag in tags if tag in scalars}
+    if return_records:
+        return scalars
+    return {tag: (steps, values) for tag, (steps, values, _) in scalars.items()}
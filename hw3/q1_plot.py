@@ -1,7 +1,7 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-from tensorboard.backend.event_processing import event_accumulator
+from rob831.infrastructure.tb_reader import read_scalars
 
 # Paths to your runs
 base_dir = "data"
@@ -17,18 +17,11 @@ ddqn_runs = [
 ]
 
 def load_returns(run_dir, tag="Train_AverageReturn"):
-    event_file = [
-        f for f in os.listdir(run_dir) if f.startswith("events.out.tfevents")
-    ][0]
-    ea = event_accumulator.EventAccumulator(os.path.join(run_dir, event_file))
-    ea.Reload()
-    if tag not in ea.Tags()['scalars']:
-        print(f"⚠️ Tag '{tag}' not found in {run_dir}. Available tags: {ea.Tags()['scalars']}")
+    scalars = read_scalars(run_dir)
+    if tag not in scalars:
+        print(f"⚠️ Tag '{tag}' not found in {run_dir}. Available tags: {sorted(scalars)}")
         return None
-    events = ea.Scalars(tag)
-    steps = [e.step for e in events]
-    values = [e.value for e in events]
-    return np.array(steps), np.array(values)
+    return scalars[tag]
 
 def aggregate_runs(run_names, tag="Train_AverageReturn"):
     all_returns = []
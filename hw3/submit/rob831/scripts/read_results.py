@@ -1,24 +1,25 @@
 import argparse
 import glob
 import os
-import tensorflow.compat.v1 as tf
-tf.disable_v2_behavior()
+
+import numpy as np
+
+from rob831.infrastructure.tb_reader import read_scalars
+
 
 def get_section_results(file):
     """
-        requires tensorflow==1.12.0
+        reads the Train_EnvstepsSoFar and Train_AverageReturn values of the first 121 iterations of an event file
     """
-    X = []
-    Y = []
-    for e in tf.train.summary_iterator(file):
-        for v in e.summary.value:
-            if v.tag == 'Train_EnvstepsSoFar':
-                X.append(v.simple_value)
-            elif v.tag == 'Train_AverageReturn':
-                Y.append(v.simple_value)
-        if len(X) > 120:
-            break
-    return X, Y
+    scalars = read_scalars(file, tags=['Train_EnvstepsSoFar', 'Train_AverageReturn'], return_records=True)
+    _, X, X_records = scalars.get('Train_EnvstepsSoFar', (None, np.zeros(0), np.zeros(0, np.int64)))
+    _, Y, Y_records = scalars.get('Train_AverageReturn', (None, np.zeros(0), np.zeros(0, np.int64)))
+    if len(X) > 120:
+        # stop at the event with the 121st env step count, whichever order the
+        # trainer logged the return of that iteration in
+        Y = Y[Y_records <= X_records[120]]
+        X = X[:121]
+    return X.tolist(), Y.tolist()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
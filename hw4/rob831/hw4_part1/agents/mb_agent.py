@@ -37,6 +37,9 @@ class MBAgent(BaseAgent):
         )
 
         self.replay_buffer = ReplayBuffer()
+        self.obs_stats = RunningMeanStd(self.agent_params['ob_dim'])
+        self.acs_stats = RunningMeanStd(self.agent_params['ac_dim'])
+        self.delta_stats = RunningMeanStd(self.agent_params['ob_dim'])
 
     def train(self, ob_no, ac_na, re_n, next_ob_no, terminal_n):
 
@@ -51,12 +54,13 @@ class MBAgent(BaseAgent):
             # select which datapoints to use for this model of the ensemble
             # you might find the num_data_per_env variable defined above useful
 
-            observations = # TODO(Q1)
-            actions = # TODO(Q1)
-            next_observations = # TODO(Q1)
+            ens_slice = slice(i * num_data_per_ens, (i + 1) * num_data_per_ens)
+            observations = ob_no[ens_slice]
+            actions = ac_na[ens_slice]
+            next_observations = next_ob_no[ens_slice]
 
             # use datapoints to update one of the dyn_models
-            model =  # TODO(Q1)
+            model = self.dyn_models[i]
             log = model.update(observations, actions, next_observations,
                                 self.data_statistics)
             loss = log['Training Loss']
@@ -72,16 +76,23 @@ class MBAgent(BaseAgent):
         # add data to replay buffer
         self.replay_buffer.add_rollouts(paths, noised=add_sl_noise)
 
+        # fold only the newly added (possibly noised) transitions into the running statistics
+        num_new = min(sum(get_pathlength(path) for path in paths), self.replay_buffer.max_size)
+        new_obs = self.replay_buffer.obs[-num_new:]
+        self.obs_stats.update(new_obs)
+        self.acs_stats.update(self.replay_buffer.acs[-num_new:])
+        self.delta_stats.update(self.replay_buffer.next_obs[-num_new:] - new_obs)
+
         # get updated mean/std of the data in our replay buffer
+        # NOTE: these cover every transition ever added, which is the buffer
+        # content until it exceeds max_size
         self.data_statistics = {
-            'obs_mean': np.mean(self.replay_buffer.obs, axis=0),
-            'obs_std': np.std(self.replay_buffer.obs, axis=0),
-            'acs_mean': np.mean(self.replay_buffer.acs, axis=0),
-            'acs_std': np.std(self.replay_buffer.acs, axis=0),
-            'delta_mean': np.mean(
-                self.replay_buffer.next_obs - self.replay_buffer.obs, axis=0),
-            'delta_std': np.std(
-                self.replay_buffer.next_obs - self.replay_buffer.obs, axis=0),
+            'obs_mean': self.obs_stats.mean.astype(np.float32),
+            'obs_std': self.obs_stats.std.astype(np.float32),
+            'acs_mean': self.acs_stats.mean.astype(np.float32),
+            'acs_std': self.acs_stats.std.astype(np.float32),
+            'delta_mean': self.delta_stats.mean.astype(np.float32),
+            'delta_std': self.delta_stats.std.astype(np.float32),
         }
 
         # update the actor's data_statistics too, so actor.get_action can be calculated correctly
@@ -1,7 +1,7 @@
 from .base_agent import BaseAgent
 from .sac_agent import SACAgent
 from .mb_agent import MBAgent
-from rob831.hw4_part1.infrastructure.replay_buffer import ReplayBuffer
+from rob831.hw4_part1.infrastructure.replay_buffer import ReplayBuffer, ModelReplayBuffer
 from rob831.hw4_part1.infrastructure.utils import *
 
 class MBPOAgent(BaseAgent):
@@ -13,49 +13,124 @@ class MBPOAgent(BaseAgent):
 
         self.actor = self.sac_agent.actor
 
+        # model rollouts are kept apart from real data and aged out by generation
+        self.model_replay_buffer = ModelReplayBuffer(
+            max_size=agent_params['model_buffer_size'],
+            max_generations=agent_params['model_retain_generations'],
+        )
+        # fraction of every SAC batch drawn from real environment data, or None
+        # to sample real and model data in proportion to their buffer sizes
+        self.real_ratio = agent_params['real_ratio']
+
     def train(self, *args):
         return self.mb_agent.train(*args)
     
     def train_sac(self, *args):
         return self.sac_agent.train(*args)
 
-    def collect_model_trajectory(self, rollout_length=1):
-        # TODO (Q6): Collect a trajectory of rollout_length from the learned 
-        # dynamics model. Start from a state sampled from the replay buffer.
+    def rollout_model(self, ob, rollout_length=1, ensemble_mode='mean'):
+        """
+            Branched rollouts from a batch of start states, all stepped together
+            through the learned dynamics ensemble. Rollouts that reach a terminal
+            state (according to env.get_reward) are dropped from the batch.
 
-        # sample 1 transition from self.mb_agent.replay_buffer
-        ob, _, _, _, terminal = TODO
+            ensemble_mode: 'mean' averages the prediction of all the dynamics models,
+                'random' uses the prediction of a random model per sample
+            returns: obs, acs, rewards, next_obs, terminals of all the generated
+                transitions, each with leading dimension = number of transitions
+        """
+        assert ensemble_mode in ('mean', 'random')
+        dyn_models = self.mb_agent.dyn_models
+        data_statistics = self.mb_agent.data_statistics
 
-        obs, acs, rewards, next_obs, terminals, image_obs = [], [], [], [], [], []
+        obs, acs, rewards, next_obs, terminals = [], [], [], [], []
         for _ in range(rollout_length):
-            # get the action from the policy
-            ac = TODO
-            
-            # determine the next observation by averaging the prediction of all the 
-            # dynamics models in the ensemble
-            next_ob = TODO
-
-            # query the reward function to determine the reward of this transition
-            # HINT: use self.env.get_reward
-            rew, _ = TODO
-
-            obs.append(ob[0])
-            acs.append(ac[0])
-            rewards.append(rew[0])
-            next_obs.append(next_ob[0])
-            terminals.append(terminal[0])
-
-            ob = next_ob
-        return [Path(obs, image_obs, acs, rewards, next_obs, terminals)]
+            if ob.shape[0] == 0:
+                break
+
+            # get the actions from the policy
+            ac = self.actor.get_action(ob)
+
+            # (ensemble_size, batch_size, ob_dim)
+            predictions = np.stack([
+                model.get_prediction(ob, ac, data_statistics)
+                for model in dyn_models
+            ])
+            if ensemble_mode == 'mean':
+                next_ob = predictions.mean(axis=0)
+            else:
+                members = np.random.randint(len(dyn_models), size=ob.shape[0])
+                next_ob = predictions[members, np.arange(ob.shape[0])]
+
+            rew, done = self.mb_agent.env.get_reward(ob, ac)
+            done = done.astype(bool)
+
+            obs.append(ob)
+            acs.append(ac)
+            rewards.append(rew)
+            next_obs.append(next_ob)
+            terminals.append(done)
+
+            ob = next_ob[~done]
+
+        return (np.concatenate(obs), np.concatenate(acs), np.concatenate(rewards),
+                np.concatenate(next_obs), np.concatenate(terminals))
+
+    def collect_model_trajectory(self, rollout_length=1):
+        # sample 1 transition from self.mb_agent.replay_buffer
+        ob, _, _, _, _ = self.mb_agent.replay_buffer.sample_random_data(1)
+        obs, acs, rewards, next_obs, terminals = self.rollout_model(ob, rollout_length)
+        return [Path(obs, [], acs, rewards, next_obs, terminals)]
+
+    def collect_model_rollouts(self, num_rollouts, rollout_length=1, ensemble_mode='mean'):
+        """
+            Runs num_rollouts branched model rollouts in parallel and adds the
+            generated transitions to the model replay buffer
+            returns: the number of transitions added
+        """
+        ob, _, _, _, _ = self.mb_agent.replay_buffer.sample_random_megabatch(num_rollouts, 1)
+        obs, acs, rewards, next_obs, terminals = self.rollout_model(ob, rollout_length, ensemble_mode)
+        self.model_replay_buffer.add_transitions(obs, acs, rewards, next_obs, terminals)
+        return obs.shape[0]
+
+    def new_model_generation(self):
+        self.model_replay_buffer.new_generation()
 
     def add_to_replay_buffer(self, paths, from_model=False, **kwargs):
-        self.sac_agent.add_to_replay_buffer(paths)
-        # only add rollouts from the real environment to the model training buffer
-        if not from_model:
+        if from_model:
+            observations, actions, next_observations, terminals, concatenated_rews, _ = convert_listofrollouts(paths)
+            self.model_replay_buffer.add_transitions(
+                observations, actions, concatenated_rews, next_observations, terminals)
+        else:
+            # only add rollouts from the real environment to the model training buffer
+            self.sac_agent.add_to_replay_buffer(paths)
             self.mb_agent.add_to_replay_buffer(paths, **kwargs)
 
     def sample(self, *args, **kwargs):
         return self.mb_agent.sample(*args, **kwargs)
 
-    def sample_sac(self, *args, **kwargs):
-        return self.sac_agent.sample(*args, **kwargs)
\ No newline at end of file
+    def sample_sac(self, batch_size):
+        if len(self.model_replay_buffer) == 0:
+            return self.sac_agent.sample(batch_size)
+
+        # decide real vs model for every slot of the (mega)batch in one draw,
+        # so each UTD minibatch slice keeps the same mix
+        num_samples = batch_size * self.sac_agent.utd_ratio
+        real_ratio = self.real_ratio
+        if real_ratio is None:
+            # uniform over the real and the model replay buffer taken together
+            num_real = self.sac_agent.replay_buffer.obs.shape[0]
+            real_ratio = num_real / (num_real + len(self.model_replay_buffer))
+        from_model = np.random.rand(num_samples) >= real_ratio
+        num_model = np.count_nonzero(from_model)
+
+        real_batch = self.sac_agent.replay_buffer.sample_random_megabatch(num_samples - num_model, 1)
+        model_batch = self.model_replay_buffer.sample_random_data(num_model)
+
+        batch = []
+        for real_data, model_data in zip(real_batch, model_batch):
+            data = np.empty((num_samples,) + real_data.shape[1:], dtype=np.float32)
+            data[~from_model] = real_data
+            data[from_model] = model_data
+            batch.append(data)
+        return tuple(batch)
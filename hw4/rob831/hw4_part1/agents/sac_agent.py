@@ -7,6 +7,8 @@ import gym
 from rob831.hw4_part1.policies.sac_policy import MLPPolicySAC
 from rob831.hw4_part1.critics.sac_critic import SACCritic
 import rob831.hw4_part1.infrastructure.pytorch_util as ptu
+from rob831.hw4_part1.infrastructure import sac_utils
+import torch
 
 class SACAgent(BaseAgent):
     def __init__(self, env: gym.Env, agent_params):
@@ -34,24 +36,82 @@ class SACAgent(BaseAgent):
         )
         self.actor_update_frequency = self.agent_params['actor_update_frequency']
         self.critic_target_update_frequency = self.agent_params['critic_target_update_frequency']
+        # update-to-data ratio: critic steps per agent update, each on its own minibatch
+        self.utd_ratio = self.agent_params['utd_ratio']
 
         self.critic = SACCritic(self.agent_params)
+        # REDQ: with more heads, the target is the min over a random subset of this many
+        self.n_target_critics = 2
         self.critic_target = copy.deepcopy(self.critic).to(ptu.device)
         self.critic_target.load_state_dict(self.critic.state_dict())
 
         self.training_step = 0
+        self.critic_step = 0
         self.replay_buffer = ReplayBuffer(max_size=100000)
 
-    def update_critic(self):
-        # TODO: get this from previous HW  
-        return critic_loss
+    def update_critic(self, ob_no, ac_na, next_ob_no, re_n, terminal_n):
+        with torch.no_grad():
+            next_ac_na, next_log_prob = self.actor.rsample_with_log_prob(next_ob_no)
+            q_tp1 = self.critic_target(next_ob_no, next_ac_na)
+            if self.critic.n_critics > self.n_target_critics:
+                heads = torch.randperm(self.critic.n_critics, device=q_tp1.device)[:self.n_target_critics]
+                q_tp1 = q_tp1[heads]
+            # clipped double-Q: min over the (sampled) heads of the target ensemble
+            q_tp1 = q_tp1.min(dim=0)[0]
+            target = re_n + self.gamma * (1 - terminal_n) * (q_tp1 - self.actor.alpha * next_log_prob)
+
+        q_values = self.critic(ob_no, ac_na)
+        # sum of the per-head MSE losses
+        critic_loss = self.critic.loss(q_values, target.expand_as(q_values)) * self.critic.n_critics
+
+        self.critic.optimizer.zero_grad()
+        critic_loss.backward()
+        self.critic.optimizer.step()
+        return critic_loss.item()
 
     def train(self, ob_no, ac_na, re_n, next_ob_no, terminal_n):
-        # TODO: get this from previous HW
+        """
+            With utd_ratio > 1 the batch is a megabatch of utd_ratio minibatches
+            (see sample); it is moved to the device once and sliced per critic step.
+        """
+        ob_no = ptu.from_numpy(ob_no)
+        ac_na = ptu.from_numpy(ac_na)
+        re_n = ptu.from_numpy(re_n)
+        next_ob_no = ptu.from_numpy(next_ob_no)
+        terminal_n = ptu.from_numpy(terminal_n)
+
+        minibatches = zip(*[
+            tensor.chunk(self.utd_ratio)
+            for tensor in (ob_no, ac_na, re_n, next_ob_no, terminal_n)
+        ])
+
+        critic_losses = []
+        for ob_b, ac_b, re_b, next_ob_b, terminal_b in minibatches:
+            for _ in range(self.agent_params['num_critic_updates_per_agent_update']):
+                critic_losses.append(self.update_critic(ob_b, ac_b, next_ob_b, re_b, terminal_b))
+
+            if self.critic_step % self.critic_target_update_frequency == 0:
+                sac_utils.soft_update_params(self.critic, self.critic_target, self.critic_tau)
+            self.critic_step += 1
+
+        loss = OrderedDict()
+        loss['Critic_Loss'] = np.mean(critic_losses)
+
+        if self.training_step % self.actor_update_frequency == 0:
+            # actor and temperature follow the agent-update cadence, on the last minibatch
+            for _ in range(self.agent_params['num_actor_updates_per_agent_update']):
+                actor_loss, alpha_loss, temperature = self.actor.update(ob_b, self.critic)
+            loss['Actor_Loss'] = actor_loss
+            loss['Alpha_Loss'] = alpha_loss
+            loss['Temperature'] = temperature
+
+        self.training_step += 1
         return loss
 
     def add_to_replay_buffer(self, paths):
         self.replay_buffer.add_rollouts(paths)
 
     def sample(self, batch_size):
+        if self.utd_ratio > 1:
+            return self.replay_buffer.sample_random_megabatch(batch_size, self.utd_ratio)
         return self.replay_buffer.sample_random_data(batch_size)
@@ -31,22 +31,17 @@ class SACCritic(nn.Module, BaseCritic):
 
         # critic parameters
         self.gamma = hparams['gamma']
-        self.Q1 = ptu.build_mlp(
+        self.n_critics = hparams['n_critics']
+        # Q1, Q2 (and any further heads) share one stacked-weight ensemble
+        self.Q = ptu.build_ensemble_mlp(
+            self.n_critics,
             self.ob_dim + self.ac_dim,
             1,
             n_layers=self.n_layers,
             size=self.size,
             activation='relu'
         )
-        self.Q2 = ptu.build_mlp(
-            self.ob_dim + self.ac_dim,
-            1,
-            n_layers=self.n_layers,
-            size=self.size,
-            activation='relu'
-        )
-        self.Q1.to(ptu.device)
-        self.Q2.to(ptu.device)
+        self.Q.to(ptu.device)
         self.loss = nn.MSELoss()
 
         self.optimizer = optim.Adam(
@@ -55,9 +50,9 @@ class SACCritic(nn.Module, BaseCritic):
         )
 
     def forward(self, obs: torch.Tensor, action: torch.Tensor):
-        # TODO: get this from previous HW
+        """
+            returns: Q-values of every head, shape (n_critics, batch_size)
+        """
+        obs_action = torch.cat([obs, action], dim=-1)
+        values = self.Q(obs_action).squeeze(-1)
         return values
-
-
-
-        
\ No newline at end of file
@@ -2,12 +2,11 @@ import gym
 import numpy as np
 from gym import spaces
 
+from rob831.hw4_part1.envs import raster
+
 class Obstacles(gym.Env):
     def __init__(self, start=[-0.5, 0.75], end=[0.7, -0.8], random_starts=True, **kwargs):
 
-        import matplotlib.pyplot as plt #inside, so doesnt get imported when not using this env
-        self.plt = plt
-
         self.action_dim = self.ac_dim = 2
         self.observation_dim = self.obs_dim = 4
         self.boundary_min = -0.99
@@ -36,9 +35,14 @@ class Obstacles(gym.Env):
         self.obstacles.append([0.6, -0.1, 0.12, 0.4])
         self.obstacles.append([-0.1, 0.2, 0.15, 0.4])
         self.obstacles.append([0.1, -0.7, 0.3, 0.15])
+        # the same rectangles as (x, y) of the bottom left and top right corners,
+        # so is_valid tests a batch against all of them in one broadcast
+        obstacles = np.array(self.obstacles)
+        self.obstacles_min = np.stack([obstacles[:, 0], obstacles[:, 1] - obstacles[:, 3]], axis=1)
+        self.obstacles_max = np.stack([obstacles[:, 0] + obstacles[:, 2], obstacles[:, 1]], axis=1)
 
         self.eps = 0.1
-        self.fig = self.plt.figure()
+        self._raster = self._make_raster()
 
     def seed(self, seed):
         np.random.seed(seed)
@@ -72,7 +76,7 @@ class Obstacles(gym.Env):
 
         #clear
         self.counter = 0
-        self.plt.clf()
+        self._raster.reset()
 
         #return
         return self._get_obs()
@@ -159,67 +163,44 @@ class Obstacles(gym.Env):
     # utility functions
     ########################################
 
-    def render(self, mode=None):
+    def _make_raster(self):
+        # limits matplotlib would autoscale to: the boundaries plus 5% margins
+        margin = 0.05 * (self.boundary_max - self.boundary_min)
+        lim = (self.boundary_min - margin, self.boundary_max + margin)
+        r = raster.Raster(lim, lim)
+        r.axes_frame()
         # boundaries
-        self.plt.plot([self.boundary_min, self.boundary_min],
-                      [self.boundary_min, self.boundary_max], 'k')
-        self.plt.plot([self.boundary_max, self.boundary_max],
-                      [self.boundary_min, self.boundary_max], 'k')
-        self.plt.plot([self.boundary_min, self.boundary_max],
-                      [self.boundary_min, self.boundary_min], 'k')
-        self.plt.plot([self.boundary_min, self.boundary_max],
-                      [self.boundary_max, self.boundary_max], 'k')
+        r.rect_outline(self.boundary_min, self.boundary_min,
+                       self.boundary_max, self.boundary_max, raster.BLACK)
         # obstacles
         for obstacle in self.obstacles:
             tl_x = obstacle[0]
             tl_y = obstacle[1]
-            tr_x = tl_x + obstacle[2]
-            tr_y = tl_y
-            bl_x = tl_x
-            bl_y = tl_y - obstacle[3]
-            br_x = tr_x
-            br_y = bl_y
-            self.plt.plot([bl_x, br_x], [bl_y, br_y], 'r')
-            self.plt.plot([tl_x, tr_x], [tl_y, tr_y], 'r')
-            self.plt.plot([bl_x, bl_x], [bl_y, tl_y], 'r')
-            self.plt.plot([br_x, br_x], [br_y, tr_y], 'r')
-        # current and end
-        self.plt.plot(self.end[0], self.end[1], 'go')
-        self.plt.plot(self.current[0], self.current[1], 'ko')
-        self.fig.canvas.draw()
-        img = np.frombuffer(self.fig.canvas.tostring_rgb(), dtype=np.uint8)
-        img = img.reshape(self.fig.canvas.get_width_height()[::-1] + (3,))
-        return [img]
+            br_x = tl_x + obstacle[2]
+            br_y = tl_y - obstacle[3]
+            r.rect_outline(tl_x, br_y, br_x, tl_y, raster.RED)
+        r.reset()
+        return r
 
-    def is_valid(self, dat):
+    def render(self, mode=None):
+        # current and end, drawn over the markers of the earlier steps of the episode
+        self._raster.dot(self.end[0], self.end[1], raster.GREEN)
+        self._raster.dot(self.current[0], self.current[1], raster.BLACK)
+        return [self._raster.frame()]
 
+    def is_valid(self, dat):
+        """
+            dat: (batchsize, 2) positions
+            returns a (batchsize,) mask, True where the position is in bounds
+            and not strictly inside an obstacle
+        """
         oob_mask = np.any(self.oob(dat), axis=1)
 
-        # old way
-        self.a = self.boundary_min + (self.boundary_max-self.boundary_min)/3.0
-        self.b = self.boundary_min + 2*(self.boundary_max-self.boundary_min)/3.0
-        data_mask = (dat[:, 0] < self.a) | (dat[:, 0] > self.b) | \
-                    (dat[:, 1] < self.a) | (dat[:, 1] > self.b)
-
-        #
-        in_obstacle = False
-        for obstacle in self.obstacles:
-            tl_x = obstacle[0]
-            tl_y = obstacle[1]
-            tr_x = tl_x + obstacle[2]
-            tr_y = tl_y
-            bl_x = tl_x
-            bl_y = tl_y - obstacle[3]
-            br_x = tr_x
-            br_y = bl_y
-
-            if dat[:, 0]>tl_x and dat[:, 0]<tr_x and dat[:, 1]>bl_y and dat[:, 1]<tl_y:
-                in_obstacle = True
-                return False
-
-        # not in obstacle, so return whether or not its in bounds
-        return (not oob_mask)
+        # (batchsize, num_obstacles)
+        pos = dat[:, None, :2]
+        in_obstacle = np.all((pos > self.obstacles_min) & (pos < self.obstacles_max), axis=2)
 
+        return ~(oob_mask | np.any(in_obstacle, axis=1))
 
     def oob(self, x):
         return (x <= self.boundary_min) | (x >= self.boundary_max)
@@ -0,0 +1,37 @@
+"""Target network synchronization with multi-tensor (foreach) ops.
+
+Each call issues a single fused op over all parameters instead of a Python
+loop with one or more kernels per tensor, except for hard_update on torch
+versions without _foreach_copy_.
+"""
+import torch
+
+
+def _param_lists(target_net, net):
+    targets = list(target_net.parameters())
+    sources = list(net.parameters())
+    assert len(targets) == len(sources), "networks have different parameter counts"
+    return targets, sources
+
+
+@torch.no_grad()
+def soft_update(target_net, net, tau):
+    """Polyak update: target <- (1 - tau) * target + tau * net."""
+    targets, sources = _param_lists(target_net, net)
+    if hasattr(torch, '_foreach_lerp_'):
+        torch._foreach_lerp_(targets, sources, tau)
+    else:
+        torch._foreach_mul_(targets, 1.0 - tau)
+        torch._foreach_add_(targets, sources, alpha=tau)
+
+
+@torch.no_grad()
+def hard_update(target_net, net):
+    """Copy the parameters of net into target_net."""
+    targets, sources = _param_lists(target_net, net)
+    if hasattr(torch, '_foreach_copy_'):
+        torch._foreach_copy_(targets, sources)
+    else:
+        # a real copy, so NaN or inf in the target does not survive
+        for target, source in zip(targets, sources):
+            target.copy_(source)
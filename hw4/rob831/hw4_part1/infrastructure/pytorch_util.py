@@ -54,6 +54,56 @@ def build_mlp(
     return nn.Sequential(*layers)
 
 
+class EnsembleLinear(nn.Module):
+    """
+        n_members independent linear layers stored as one stacked weight
+        input: (batch_size, in_features), shared by all members, or
+            (n_members, batch_size, in_features)
+        output: (n_members, batch_size, out_features)
+    """
+    def __init__(self, n_members: int, in_features: int, out_features: int):
+        super().__init__()
+        self.weight = nn.Parameter(torch.empty(n_members, in_features, out_features))
+        self.bias = nn.Parameter(torch.empty(n_members, 1, out_features))
+        # same initialization as nn.Linear, for every member
+        bound = 1. / in_features ** 0.5
+        nn.init.uniform_(self.weight, -bound, bound)
+        nn.init.uniform_(self.bias, -bound, bound)
+
+    def forward(self, x):
+        return torch.matmul(x, self.weight) + self.bias
+
+
+def build_ensemble_mlp(
+        n_members: int,
+        input_size: int,
+        output_size: int,
+        n_layers: int,
+        size: int,
+        activation: Activation = 'tanh',
+        output_activation: Activation = 'identity',
+):
+    """
+        Builds n_members feedforward networks with the architecture of build_mlp
+        whose layers are evaluated for all members in one batched matmul
+        returns:
+            a module mapping (batch_size, input_size) to (n_members, batch_size, output_size)
+    """
+    if isinstance(activation, str):
+        activation = _str_to_activation[activation]
+    if isinstance(output_activation, str):
+        output_activation = _str_to_activation[output_activation]
+    layers = []
+    in_size = input_size
+    for _ in range(n_layers):
+        layers.append(EnsembleLinear(n_members, in_size, size))
+        layers.append(activation)
+        in_size = size
+    layers.append(EnsembleLinear(n_members, in_size, output_size))
+    layers.append(output_activation)
+    return nn.Sequential(*layers)
+
+
 device = None
 
 
@@ -1,4 +1,5 @@
 from rob831.hw4_part1.infrastructure.utils import *
+from collections import deque
 
 
 class ReplayBuffer(object):
@@ -64,6 +65,15 @@ class ReplayBuffer(object):
         rand_indices = np.random.permutation(self.obs.shape[0])[:batch_size]
         return self.obs[rand_indices], self.acs[rand_indices], self.concatenated_rews[rand_indices], self.next_obs[rand_indices], self.terminals[rand_indices]
 
+    def sample_random_megabatch(self, batch_size, num_batches):
+        """
+            Samples num_batches minibatches of batch_size back to back in one draw.
+            Indices are drawn with replacement, so there is no O(buffer size)
+            permutation per call and num_batches * batch_size may exceed the buffer.
+        """
+        rand_indices = np.random.randint(0, self.obs.shape[0], size=batch_size * num_batches)
+        return self.obs[rand_indices], self.acs[rand_indices], self.concatenated_rews[rand_indices], self.next_obs[rand_indices], self.terminals[rand_indices]
+
     def sample_recent_data(self, batch_size=1, concat_rew=True):
 
         if concat_rew:
@@ -80,3 +90,84 @@ class ReplayBuffer(object):
             rollouts_to_return = self.paths[-num_recent_rollouts_to_return:]
             observations, actions, next_observations, terminals, concatenated_rews, unconcatenated_rews = convert_listofrollouts(rollouts_to_return)
             return observations, actions, unconcatenated_rews, next_observations, terminals
+
+
+class ModelReplayBuffer(object):
+    """
+        Fixed-capacity ring buffer for model-generated transitions.
+        Transitions are tagged with the generation (MBPO epoch) they were
+        generated in; starting a new generation evicts everything older than
+        the last max_generations generations by moving the tail pointer.
+    """
+
+    def __init__(self, max_size=400000, max_generations=5):
+
+        self.max_size = max_size
+        self.max_generations = max_generations
+        self.obs = None
+        self.acs = None
+        self.concatenated_rews = None
+        self.next_obs = None
+        self.terminals = None
+
+        self.start = 0
+        self.size = 0
+        self.generation = 0
+        # (generation, number of transitions still in the buffer), oldest first
+        self.generation_sizes = deque([[self.generation, 0]])
+
+    def __len__(self):
+        return self.size
+
+    def _allocate(self, observations, actions):
+        self.obs = np.empty((self.max_size,) + observations.shape[1:], dtype=np.float32)
+        self.acs = np.empty((self.max_size,) + actions.shape[1:], dtype=np.float32)
+        self.concatenated_rews = np.empty(self.max_size, dtype=np.float32)
+        self.next_obs = np.empty_like(self.obs)
+        self.terminals = np.empty(self.max_size, dtype=np.float32)
+
+    def _evict_oldest(self, num_transitions):
+        # drop num_transitions from the tail, generation by generation
+        while num_transitions > 0:
+            oldest = self.generation_sizes[0]
+            num_evicted = min(oldest[1], num_transitions)
+            oldest[1] -= num_evicted
+            self.start = (self.start + num_evicted) % self.max_size
+            self.size -= num_evicted
+            num_transitions -= num_evicted
+            if oldest[1] == 0 and len(self.generation_sizes) > 1:
+                self.generation_sizes.popleft()
+
+    def new_generation(self):
+        self.generation += 1
+        self.generation_sizes.append([self.generation, 0])
+        while len(self.generation_sizes) > self.max_generations:
+            _, num_transitions = self.generation_sizes.popleft()
+            self.start = (self.start + num_transitions) % self.max_size
+            self.size -= num_transitions
+
+    def add_transitions(self, observations, actions, rewards, next_observations, terminals):
+        if self.obs is None:
+            self._allocate(observations, actions)
+
+        # only the most recent max_size transitions can be kept
+        observations, actions, rewards, next_observations, terminals = [
+            data[-self.max_size:]
+            for data in (observations, actions, rewards, next_observations, terminals)
+        ]
+        num_new = observations.shape[0]
+        self._evict_oldest(self.size + num_new - self.max_size)
+
+        idxs = (self.start + self.size + np.arange(num_new)) % self.max_size
+        self.obs[idxs] = observations
+        self.acs[idxs] = actions
+        self.concatenated_rews[idxs] = rewards
+        self.next_obs[idxs] = next_observations
+        self.terminals[idxs] = terminals
+
+        self.size += num_new
+        self.generation_sizes[-1][1] += num_new
+
+    def sample_random_data(self, batch_size):
+        rand_indices = (self.start + np.random.randint(0, self.size, size=batch_size)) % self.max_size
+        return self.obs[rand_indices], self.acs[rand_indices], self.concatenated_rews[rand_indices], self.next_obs[rand_indices], self.terminals[rand_indices]
@@ -3,6 +3,7 @@ import pickle
 import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import gym
 from gym import wrappers
@@ -26,6 +27,32 @@ MAX_NVIDEO = 2
 MAX_VIDEO_LEN = 40 # we overwrite this in the code below
 
 
+def save_model_prediction_plots(logdir, itr, true_states, pred_states, errors, all_losses):
+    """
+        Saves the true vs. predicted states of one sequence for every model and
+        the training losses of this iteration. Uses matplotlib's object-oriented
+        API (no pyplot state), so it is safe to call off the training thread.
+    """
+    from matplotlib.figure import Figure
+
+    ob_dim = 2*int(true_states.shape[1]/2.0) ## skip last state for plotting when state dim is odd
+
+    # plot the predictions
+    fig = Figure()
+    for i in range(ob_dim):
+        ax = fig.add_subplot(ob_dim//2, 2, i+1)
+        ax.plot(true_states[:,i], 'g')
+        for model_pred_states in pred_states:
+            ax.plot(model_pred_states[:,i], 'r')
+    fig.suptitle('MPE: ' + str(errors.mean()))
+    fig.savefig(logdir+'/itr_'+str(itr)+'_predictions.png', dpi=200, bbox_inches='tight')
+
+    # plot all intermediate losses during this iteration
+    fig = Figure()
+    fig.add_subplot(1, 1, 1).plot(all_losses)
+    fig.savefig(logdir+'/itr_'+str(itr)+'_losses.png', dpi=200, bbox_inches='tight')
+
+
 class RL_Trainer(object):
 
     def __init__(self, params):
@@ -37,6 +64,8 @@ class RL_Trainer(object):
         # Get params, create logger
         self.params = params
         self.logger = Logger(self.params['logdir'])
+        self.plot_executor = None
+        self.plot_futures = []
 
         # Set random seeds
         seed = self.params['seed']
@@ -159,13 +188,20 @@ class RL_Trainer(object):
 
             # if doing MBPO, train the model free component
             if isinstance(self.agent, MBPOAgent):
+                # model data from this iteration on belongs to a new generation
+                self.agent.new_model_generation()
+                if self.params['mbpo_rollout_length'] > 0:
+                    # branched rollouts from all the start states of this iteration at once,
+                    # by default one per SAC iteration, into the agent's model replay buffer
+                    num_rollouts = self.params['mbpo_rollout_batch_size']
+                    if num_rollouts is None:
+                        num_rollouts = self.sac_params['n_iter']
+                    self.agent.collect_model_rollouts(
+                        num_rollouts,
+                        self.params['mbpo_rollout_length'],
+                        self.params['mbpo_ensemble_mode'],
+                    )
                 for _ in range(self.sac_params['n_iter']):
-                    if self.params['mbpo_rollout_length'] > 0:
-                        # TODO(Q6): Collect trajectory of length self.params['mbpo_rollout_length'] from the 
-                        # learned dynamics model. Add this trajectory to the correct replay buffer.
-                        # HINT: Look at collect_model_trajectory and add_to_replay_buffer from MBPOAgent.
-                        # HINT: Use the from_model argument to ensure the paths are added to the correct buffer.
-                        pass
                     # train the SAC agent
                     self.train_sac_agent()
 
@@ -182,9 +218,33 @@ class RL_Trainer(object):
                 if self.params['save_params']:
                     self.agent.save('{}/agent_itr_{}.pt'.format(self.params['logdir'], itr))
 
+        self.finish_plots()
+
     ####################################
     ####################################
 
+    def submit_plot(self, fn, *args):
+        """
+            Runs fn(*args) on the background plotting thread. Errors of earlier
+            plots that have finished by now are raised here.
+        """
+        if self.plot_executor is None:
+            self.plot_executor = ThreadPoolExecutor(max_workers=1)
+        for future in [future for future in self.plot_futures if future.done()]:
+            self.plot_futures.remove(future)
+            future.result()
+        self.plot_futures.append(self.plot_executor.submit(fn, *args))
+
+    def finish_plots(self):
+        """Waits for the pending plots, raising their errors, and stops the plotting thread"""
+        if self.plot_executor is None:
+            return
+        self.plot_executor.shutdown(wait=True)
+        self.plot_executor = None
+        futures, self.plot_futures = self.plot_futures, []
+        for future in futures:
+            future.result()
+
     def collect_training_trajectories(self, itr, initial_expertdata, collect_policy, num_transitions_to_sample, save_expert_data_to_disk=False):
         """
         :param itr:
@@ -196,21 +256,46 @@ class RL_Trainer(object):
             envsteps_this_batch: the sum over the numbers of environment steps in paths
             train_video_paths: paths which also contain videos for visualization purposes
         """
-        # TODO: get this from previous HW
+        if itr == 0:
+            if initial_expertdata is not None:
+                paths = pickle.load(open(self.params['expert_data'], 'rb'))
+                return paths, 0, None
+            if save_expert_data_to_disk:
+                num_transitions_to_sample = self.params['batch_size_initial']
+
+        # collect data to be used for training
+        print("\nCollecting data to be used for training...")
+        paths, envsteps_this_batch = utils.sample_trajectories(self.env, collect_policy, num_transitions_to_sample, self.params['ep_len'])
+
+        # collect more rollouts with the same policy, to be saved as videos in tensorboard
+        train_video_paths = None
+        if self.log_video:
+            print('\nCollecting train rollouts to be used for saving videos...')
+            train_video_paths = utils.sample_n_trajectories(self.env, collect_policy, MAX_NVIDEO, MAX_VIDEO_LEN, True)
+
+        if save_expert_data_to_disk and itr == 0:
+            with open('expert_data_{}.pkl'.format(self.params['env_name']), 'wb') as file:
+                pickle.dump(paths, file)
 
         return paths, envsteps_this_batch, train_video_paths
 
     def train_agent(self):
-        # TODO: get this from previous HW
-        pass
+        all_logs = []
+        for train_step in range(self.params['num_agent_train_steps_per_iter']):
+            ob_batch, ac_batch, re_batch, next_ob_batch, terminal_batch = self.agent.sample(self.params['train_batch_size'])
+            train_log = self.agent.train(ob_batch, ac_batch, re_batch, next_ob_batch, terminal_batch)
+            all_logs.append(train_log)
+        return all_logs
 
     def train_sac_agent(self):
-        # TODO: Train the SAC component of the MBPO agent.
-        # For self.sac_params['num_agent_train_steps_per_iter']:
-        # 1) sample a batch of data of size self.sac_params['train_batch_size'] with self.agent.sample_sac
-        # 2) train the SAC agent self.agent.train_sac
-        # HINT: This will look similar to train_agent above.
-        pass
+        # with sac_params['utd_ratio'] > 1, sample_sac returns one megabatch of
+        # utd_ratio * train_batch_size transitions that train_sac slices per critic step
+        all_logs = []
+        for train_step in range(self.sac_params['num_agent_train_steps_per_iter']):
+            ob_batch, ac_batch, re_batch, next_ob_batch, terminal_batch = self.agent.sample_sac(self.sac_params['train_batch_size'])
+            train_log = self.agent.train_sac(ob_batch, ac_batch, re_batch, next_ob_batch, terminal_batch)
+            all_logs.append(train_log)
+        return all_logs
 
     ####################################
     ####################################
@@ -281,32 +366,23 @@ class RL_Trainer(object):
     def log_model_predictions(self, itr, all_logs):
         # model predictions
 
-        import matplotlib.pyplot as plt
-        self.fig = plt.figure()
-
         # sample actions
-        action_sequence = self.agent.actor.sample_action_sequences(num_sequences=1, horizon=10) #20 reacher
-        action_sequence = action_sequence[0]
-
-        # calculate and log model prediction error
-        mpe, true_states, pred_states = utils.calculate_mean_prediction_error(self.env, action_sequence, self.agent.dyn_models, self.agent.actor.data_statistics)
-        assert self.params['agent_params']['ob_dim'] == true_states.shape[1] == pred_states.shape[1]
-        ob_dim = self.params['agent_params']['ob_dim']
-        ob_dim = 2*int(ob_dim/2.0) ## skip last state for plotting when state dim is odd
-
-        # plot the predictions
-        self.fig.clf()
-        for i in range(ob_dim):
-            plt.subplot(ob_dim//2, 2, i+1)
-            plt.plot(true_states[:,i], 'g')
-            plt.plot(pred_states[:,i], 'r')
-        self.fig.suptitle('MPE: ' + str(mpe))
-        self.fig.savefig(self.params['logdir']+'/itr_'+str(itr)+'_predictions.png', dpi=200, bbox_inches='tight')
-
-        # plot all intermediate losses during this iteration
+        action_sequences = self.agent.actor.sample_action_sequences(
+            num_sequences=self.params['mpe_num_sequences'], horizon=10) #20 reacher
+
+        # calculate and log the prediction error of every model at every horizon
+        errors, true_states, pred_states, _ = utils.calculate_prediction_error_curves(
+            self.env, action_sequences, self.agent.dyn_models, self.agent.actor.data_statistics)
+        assert self.params['agent_params']['ob_dim'] == true_states.shape[-1] == pred_states.shape[-1]
+        for h, error in enumerate(errors.mean(axis=0)):
+            self.logger.log_scalar(error, 'Model_Prediction_Error_Horizon_{}'.format(h+1), itr)
+        for i, model_errors in enumerate(errors):
+            self.logger.log_scalar(model_errors.mean(), 'Model_{}_Prediction_Error'.format(i), itr)
+
+        # plotting only writes files, so it runs on a background thread
         all_losses = np.array([log['Training Loss'] for log in all_logs])
         np.save(self.params['logdir']+'/itr_'+str(itr)+'_losses.npy', all_losses)
-        self.fig.clf()
-        plt.plot(all_losses)
-        self.fig.savefig(self.params['logdir']+'/itr_'+str(itr)+'_losses.png', dpi=200, bbox_inches='tight')
+        self.submit_plot(
+            save_model_prediction_plots, self.params['logdir'], itr,
+            true_states[0], pred_states[:, 0], errors, all_losses)
 
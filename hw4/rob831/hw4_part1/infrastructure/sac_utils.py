@@ -2,12 +2,29 @@ import math
 from torch import distributions as dist
 import torch.nn.functional as F
 import torch.nn as nn
+import torch
+from rob831.hw4_part1.infrastructure import param_sync
 
+_HALF_LOG_2PI = 0.5 * math.log(2 * math.pi)
 
 def soft_update_params(net, target_net, tau):
-    for param, target_param in zip(net.parameters(), target_net.parameters()):
-        target_param.data.copy_(tau * param.data +
-                                (1 - tau) * target_param.data)
+    param_sync.soft_update(target_net, net, tau)
+
+def squashed_normal_rsample(loc, log_std):
+    """
+        Reparameterized sample from SquashedNormal(loc, exp(log_std)) together with
+        its log-prob summed over the action dimension, in a few fused tensor ops
+
+        returns:
+            action: tanh(loc + exp(log_std) * eps), shape (batch_size, ac_dim)
+            log_prob: shape (batch_size,)
+    """
+    eps = torch.randn_like(loc)
+    x = loc + log_std.exp() * eps
+    # Normal log-density of x, written in terms of eps, minus TanhTransform.log_abs_det_jacobian
+    log_prob = (-0.5 * eps.pow(2) - log_std - _HALF_LOG_2PI
+                - 2. * (math.log(2.) - x - F.softplus(-2. * x)))
+    return x.tanh(), log_prob.sum(-1)
 
 class TanhTransform(dist.transforms.Transform):
     domain = dist.constraints.real
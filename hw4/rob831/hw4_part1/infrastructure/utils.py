@@ -5,26 +5,44 @@ import copy
 ############################################
 ############################################
 
-def calculate_mean_prediction_error(env, action_sequence, models, data_statistics):
-
-    model = models[0]
-
-    # true
-    true_states = perform_actions(env, action_sequence)['observation']
-
-    # predicted
-    ob = np.expand_dims(true_states[0],0)
-    pred_states = []
-    for ac in action_sequence:
-        pred_states.append(ob)
-        action = np.expand_dims(ac,0)
-        ob = model.get_prediction(ob, action, data_statistics)
-    pred_states = np.squeeze(pred_states)
-
-    # mpe
-    mpe = mean_squared_error(pred_states, true_states)
-
-    return mpe, true_states, pred_states
+def calculate_prediction_error_curves(env, action_sequences, models, data_statistics):
+    """
+        Rolls every model open-loop along many held-out real trajectories at once.
+        Each action sequence is executed in env to get the true states, then all
+        sequences are stepped through each model as one batch.
+
+        action_sequences: (num_sequences, horizon, ac_dim)
+        returns:
+            errors: (num_models, horizon), squared error after h+1 model steps,
+                averaged over state dims and over sequences still running at h+1
+            true_states: (num_sequences, horizon + 1, ob_dim)
+            pred_states: (num_models, num_sequences, horizon + 1, ob_dim)
+            valid: (num_sequences, horizon + 1), False after an episode ended early
+    """
+    num_sequences, horizon, _ = action_sequences.shape
+
+    # true, padded with the last state when an episode terminates early
+    paths = [perform_actions(env, actions) for actions in action_sequences]
+    ob_dim = paths[0]['observation'].shape[1]
+    true_states = np.zeros((num_sequences, horizon + 1, ob_dim), dtype=np.float32)
+    valid = np.zeros((num_sequences, horizon + 1), dtype=bool)
+    for i, path in enumerate(paths):
+        path_states = np.concatenate([path['observation'][:1], path['next_observation']])
+        true_states[i, :len(path_states)] = path_states
+        true_states[i, len(path_states):] = path_states[-1]
+        valid[i, :len(path_states)] = True
+
+    # predicted, all sequences in one batch per model and step
+    pred_states = np.zeros((len(models),) + true_states.shape, dtype=np.float32)
+    pred_states[:, :, 0] = true_states[:, 0]
+    for t in range(horizon):
+        for m, model in enumerate(models):
+            pred_states[m, :, t+1] = model.get_prediction(
+                pred_states[m, :, t], action_sequences[:, t], data_statistics)
+
+    squared_error = np.mean((pred_states - true_states) ** 2, axis=-1)
+    errors = (squared_error * valid).sum(axis=1) / np.maximum(valid.sum(axis=0), 1)
+    return errors[:, 1:], true_states, pred_states, valid
 
 def perform_actions(env, actions):
     ob = env.reset()
@@ -54,23 +72,71 @@ def mean_squared_error(a, b):
 ############################################
 ############################################
 
-def sample_trajectory(env, policy, max_path_length, render=False):
-# TODO: get this from previous HW
+def sample_trajectory(env, policy, max_path_length, render=False, render_mode=('rgb_array')):
+    ob = env.reset()
+    obs, acs, rewards, next_obs, terminals, image_obs = [], [], [], [], [], []
+    steps = 0
+    while True:
+        if render:
+            if 'rgb_array' in render_mode:
+                if hasattr(env.unwrapped, 'sim'):
+                    if 'track' in env.unwrapped.model.camera_names:
+                        image_obs.append(env.unwrapped.sim.render(camera_name='track', height=500, width=500)[::-1])
+                    else:
+                        image_obs.append(env.unwrapped.sim.render(height=500, width=500)[::-1])
+                else:
+                    image_obs.append(env.render(mode=render_mode))
+            if 'human' in render_mode:
+                env.render(mode=render_mode)
+                time.sleep(env.model.opt.timestep)
+        obs.append(ob)
+        # both the MPC and the SAC policy return a batch of one action
+        ac = policy.get_action(ob)
+        ac = ac[0]
+        acs.append(ac)
+        ob, rew, done, _ = env.step(ac)
+        # add the observation after taking a step to next_obs
+        next_obs.append(ob)
+        rewards.append(rew)
+        steps += 1
+        # If the episode ended, the corresponding terminal value is 1
+        # otherwise, it is 0
+        if done or steps > max_path_length:
+            terminals.append(1)
+            break
+        else:
+            terminals.append(0)
 
-def sample_trajectories(env, policy, min_timesteps_per_batch, max_path_length, render=False):
+    return Path(obs, image_obs, acs, rewards, next_obs, terminals)
+
+def sample_trajectories(env, policy, min_timesteps_per_batch, max_path_length, render=False, render_mode=('rgb_array')):
     """
         Collect rollouts using policy
         until we have collected min_timesteps_per_batch steps
     """
-    # TODO: get this from previous HW
+    timesteps_this_batch = 0
+    paths = []
+    while timesteps_this_batch < min_timesteps_per_batch:
+
+        #collect rollout
+        path = sample_trajectory(env, policy, max_path_length, render, render_mode)
+        paths.append(path)
+
+        #count steps
+        timesteps_this_batch += get_pathlength(path)
+        print('At timestep:    ', timesteps_this_batch, '/', min_timesteps_per_batch, end='\r')
 
     return paths, timesteps_this_batch
 
-def sample_n_trajectories(env, policy, ntraj, max_path_length, render=False):
+def sample_n_trajectories(env, policy, ntraj, max_path_length, render=False, render_mode=('rgb_array')):
     """
         Collect ntraj rollouts using policy
     """
-    # TODO: get this from Piazza
+    paths = []
+    for i in range(ntraj):
+        # collect rollout
+        path = sample_trajectory(env, policy, max_path_length, render, render_mode)
+        paths.append(path)
 
     return paths
 
@@ -137,3 +203,34 @@ def add_noise(data_inp, noiseToSignal=0.01):
             0, np.absolute(std_of_noise[j]), (data.shape[0],)))
 
     return data
+
+class RunningMeanStd(object):
+    """
+        Running mean/std over the first axis of every batch passed to update,
+        merged with Chan et al.'s parallel variance formula so each update
+        costs O(batch size) regardless of how much data came before.
+        std matches np.std (ddof=0) over all data seen so far.
+    """
+
+    def __init__(self, shape=()):
+        self.count = 0
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.m2 = np.zeros(shape, dtype=np.float64)
+
+    def update(self, x):
+        batch_count = x.shape[0]
+        if batch_count == 0:
+            return
+        x = x.astype(np.float64)
+        batch_mean = x.mean(axis=0)
+        batch_m2 = np.square(x - batch_mean).sum(axis=0)
+
+        delta = batch_mean - self.mean
+        total_count = self.count + batch_count
+        self.mean = self.mean + delta * batch_count / total_count
+        self.m2 = self.m2 + batch_m2 + np.square(delta) * self.count * batch_count / total_count
+        self.count = total_count
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count, 1))
@@ -34,6 +34,8 @@ class FFModel(nn.Module, BaseModel):
         self.acs_std = None
         self.delta_mean = None
         self.delta_std = None
+        # the data_statistics dict the tensors above were built from
+        self.data_statistics = None
 
     def update_statistics(
             self,
@@ -51,6 +53,15 @@ class FFModel(nn.Module, BaseModel):
         self.delta_mean = ptu.from_numpy(delta_mean)
         self.delta_std = ptu.from_numpy(delta_std)
 
+    def _statistics_tensors(self, data_statistics):
+        # MBAgent builds a new data_statistics dict whenever the statistics change,
+        # so the device copies only need refreshing when a different dict comes in
+        if data_statistics is not self.data_statistics:
+            self.update_statistics(**data_statistics)
+            self.data_statistics = data_statistics
+        return (self.obs_mean, self.obs_std, self.acs_mean,
+                self.acs_std, self.delta_mean, self.delta_std)
+
     def forward(
             self,
             obs_unnormalized,
@@ -78,8 +89,8 @@ class FFModel(nn.Module, BaseModel):
                 unnormalized) output of the delta network. This is needed
         """
         # normalize input data to mean 0, std 1
-        obs_normalized = # TODO(Q1)
-        acs_normalized = # TODO(Q1)
+        obs_normalized = normalize(obs_unnormalized, obs_mean, obs_std)
+        acs_normalized = normalize(acs_unnormalized, acs_mean, acs_std)
 
         # predicted change in obs
         concatenated_input = torch.cat([obs_normalized, acs_normalized], dim=1)
@@ -87,8 +98,8 @@ class FFModel(nn.Module, BaseModel):
         # TODO(Q1) compute delta_pred_normalized and next_obs_pred
         # Hint: as described in the PDF, the output of the network is the
         # *normalized change* in state, i.e. normalized(s_t+1 - s_t).
-        delta_pred_normalized = # TODO(Q1)
-        next_obs_pred = # TODO(Q1)
+        delta_pred_normalized = self.delta_network(concatenated_input)
+        next_obs_pred = obs_unnormalized + unnormalize(delta_pred_normalized, delta_mean, delta_std)
         return next_obs_pred, delta_pred_normalized
 
     def get_prediction(self, obs, acs, data_statistics):
@@ -105,9 +116,13 @@ class FFModel(nn.Module, BaseModel):
              - 'delta_std'
         :return: a numpy array of the predicted next-states (s_t+1)
         """
-        prediction = # TODO(Q1) get the predicted next-states (s_t+1) as a numpy array
-        # Hint: `self(...)` returns a tuple, but you only need to use one of the
-        # outputs.
+        with torch.no_grad():
+            prediction, _ = self(
+                ptu.from_numpy(obs),
+                ptu.from_numpy(acs),
+                *self._statistics_tensors(data_statistics),
+            )
+        prediction = ptu.to_numpy(prediction)
         return prediction
 
     def update(self, observations, actions, next_observations, data_statistics):
@@ -125,14 +140,20 @@ class FFModel(nn.Module, BaseModel):
              - 'delta_std'
         :return:
         """
-        target = # TODO(Q1) compute the normalized target for the model.
-        # Hint: you should use `data_statistics['delta_mean']` and
-        # `data_statistics['delta_std']`, which keep track of the mean
-        # and standard deviation of the model.
+        statistics = self._statistics_tensors(data_statistics)
+        observations = ptu.from_numpy(observations)
+        target = normalize(
+            ptu.from_numpy(next_observations) - observations,
+            self.delta_mean,
+            self.delta_std,
+        )
 
-        loss = # TODO(Q1) compute the loss
-        # Hint: `self(...)` returns a tuple, but you only need to use one of the
-        # outputs.
+        _, delta_pred_normalized = self(
+            observations,
+            ptu.from_numpy(actions),
+            *statistics,
+        )
+        loss = self.loss(delta_pred_normalized, target)
 
         self.optimizer.zero_grad()
         loss.backward()
@@ -35,12 +35,34 @@ class MLPPolicySAC(MLPPolicy):
 
     @property
     def alpha(self):
-        # TODO: get this from previous HW
+        """The entropy temperature, learned as log_alpha so it stays positive"""
+        entropy = self.log_alpha.exp()
         return entropy
 
     def get_action(self, obs: np.ndarray, sample=True) -> np.ndarray:
-        # TODO: get this from previous HW
-        return action
+        """
+            Sampled action for one observation or a batch of them, or with
+            sample=False the deterministic tanh(mean), clamped to action_range
+        """
+        if len(obs.shape) > 1:
+            observation = obs
+        else:
+            observation = obs[None]
+        observation = ptu.from_numpy(observation)
+
+        with torch.no_grad():
+            if sample:
+                action, _ = self.rsample_with_log_prob(observation)
+            else:
+                loc, _ = self._loc_and_log_std(observation)
+                action = loc.tanh()
+        action = action.clamp(*self.action_range)
+        return ptu.to_numpy(action)
+
+    def _loc_and_log_std(self, observation: torch.FloatTensor):
+        loc = self.mean_net(observation)
+        log_std = torch.clamp(self.logstd, *self.log_std_bounds).expand_as(loc)
+        return loc, log_std
 
     # This function defines the forward pass of the network.
     # You can return anything you want, but you should be able to differentiate
@@ -48,9 +70,40 @@ class MLPPolicySAC(MLPPolicy):
     # return more flexible objects, such as a
     # `torch.distributions.Distribution` object. It's up to you!
     def forward(self, observation: torch.FloatTensor):
-        # TODO: get this from previous HW
+        loc, log_std = self._loc_and_log_std(observation)
+        action_distribution = sac_utils.SquashedNormal(loc, log_std.exp())
         return action_distribution
 
+    def rsample_with_log_prob(self, observation: torch.FloatTensor):
+        """
+            Same values as rsample() + log_prob().sum(-1) on forward(observation),
+            without going through torch.distributions
+        """
+        loc, log_std = self._loc_and_log_std(observation)
+        return sac_utils.squashed_normal_rsample(loc, log_std)
+
     def update(self, obs, critic):
-        # TODO: get this from previous HW
-        return actor_loss, alpha_loss, self.alpha
\ No newline at end of file
+        """
+            One actor step on alpha * log_prob - Q of reparameterized actions,
+            then one temperature step towards target_entropy
+            returns:
+                actor loss, temperature loss and the temperature, as floats
+        """
+        action, log_prob = self.rsample_with_log_prob(obs)
+        q_values = critic(obs, action)
+        # min over twin heads as in SAC; larger ensembles use the mean over all
+        # heads as in REDQ, since the min over many heads is overly pessimistic
+        q_values = q_values.min(dim=0)[0] if critic.n_critics <= 2 else q_values.mean(dim=0)
+        actor_loss = (self.alpha.detach() * log_prob - q_values).mean()
+
+        self.optimizer.zero_grad()
+        actor_loss.backward()
+        self.optimizer.step()
+
+        alpha_loss = (-self.alpha * (log_prob.detach() + self.target_entropy)).mean()
+
+        self.log_alpha_optimizer.zero_grad()
+        alpha_loss.backward()
+        self.log_alpha_optimizer.step()
+
+        return actor_loss.item(), alpha_loss.item(), self.alpha.item()
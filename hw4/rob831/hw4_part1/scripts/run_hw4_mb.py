@@ -77,6 +77,7 @@ def main():
     parser.add_argument('--batch_size', '-b', type=int, default=8000) #steps collected per train iteration (put into replay buffer)
     parser.add_argument('--train_batch_size', '-tb', type=int, default=512) ##steps used per gradient step (used for training)
     parser.add_argument('--eval_batch_size', '-eb', type=int, default=400) #steps collected per eval iteration
+    parser.add_argument('--mpe_num_sequences', type=int, default=20) #held-out action sequences for the model prediction error
 
     parser.add_argument('--learning_rate', '-lr', type=float, default=0.001)
     parser.add_argument('--n_layers', '-l', type=int, default=2)
@@ -26,6 +26,7 @@ class MBPO_Trainer(object):
             'n_layers': params['sac_n_layers'],
             'size': params['sac_size'],
             'learning_rate': params['sac_learning_rate'],
+            'n_critics': params['sac_n_critics'],
             'init_temperature': params['sac_init_temperature'],
             'actor_update_frequency': params['sac_actor_update_frequency'],
             'critic_target_update_frequency': params['sac_critic_target_update_frequency']
@@ -39,6 +40,7 @@ class MBPO_Trainer(object):
             'num_agent_train_steps_per_iter': params['sac_num_agent_train_steps_per_iter'],
             'num_critic_updates_per_agent_update': params['sac_num_critic_updates_per_agent_update'],
             'num_actor_updates_per_agent_update': params['sac_num_actor_updates_per_agent_update'],
+            'utd_ratio': params['sac_utd_ratio'],
             'n_iter': params['sac_n_iter'],
             'train_batch_size': params['sac_train_batch_size']
         }
@@ -56,7 +58,13 @@ class MBPO_Trainer(object):
             'cem_alpha': params['cem_alpha'],
         }
 
-        mb_agent_params = {**mb_computation_graph_args, **mb_train_args, **controller_args}
+        mbpo_args = {
+            'model_buffer_size': params['mbpo_model_buffer_size'],
+            'model_retain_generations': params['mbpo_model_retain_generations'],
+            'real_ratio': params['mbpo_real_ratio'],
+        }
+
+        mb_agent_params = {**mb_computation_graph_args, **mb_train_args, **controller_args, **mbpo_args}
         sac_agent_params = {**sac_computation_graph_args, **estimate_advantage_args, **sac_train_args}
         agent_params = {**mb_agent_params}
         agent_params['sac_params'] = sac_agent_params
@@ -118,6 +126,7 @@ def main():
     parser.add_argument('--sac_num_agent_train_steps_per_iter', type=int, default=1)
     parser.add_argument('--sac_num_critic_updates_per_agent_update', type=int, default=1)
     parser.add_argument('--sac_num_actor_updates_per_agent_update', type=int, default=1)
+    parser.add_argument('--sac_utd_ratio', type=int, default=1) # critic steps per agent update, each on a fresh minibatch
     parser.add_argument('--sac_actor_update_frequency', type=int, default=1)
     parser.add_argument('--sac_critic_target_update_frequency', type=int, default=1)
     parser.add_argument('--sac_train_batch_size', type=int, default=256) ##steps used per gradient step
@@ -128,9 +137,15 @@ def main():
     parser.add_argument('--sac_n_layers', type=int, default=2)
     parser.add_argument('--sac_size', type=int, default=64)
     parser.add_argument('--sac_n_iter', type=int, default=200)
+    parser.add_argument('--sac_n_critics', type=int, default=2) # Q-heads in the critic ensemble, 2 is clipped double-Q, more is REDQ
 
     # MBPO parameters
     parser.add_argument('--mbpo_rollout_length', type=int, default=1)
+    parser.add_argument('--mbpo_rollout_batch_size', type=int, default=None) # start states rolled out in parallel per training iteration, default: sac_n_iter
+    parser.add_argument('--mbpo_ensemble_mode', type=str, default='mean', choices=['mean', 'random'])
+    parser.add_argument('--mbpo_model_buffer_size', type=int, default=400000)
+    parser.add_argument('--mbpo_model_retain_generations', type=int, default=5) # training iterations of model data kept
+    parser.add_argument('--mbpo_real_ratio', type=float, default=None) # fraction of each SAC batch from real data, default: in proportion to the buffer sizes
 
     args = parser.parse_args()
 
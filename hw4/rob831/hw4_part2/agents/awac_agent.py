@@ -17,15 +17,19 @@ import torch
 class AWACAgent(DQNAgent):
     def __init__(self, env, agent_params, normalize_rnd=True, rnd_gamma=0.99):
         super(AWACAgent, self).__init__(env, agent_params)
+        # the critics are DQN critics, which only give Q-values of discrete actions
+        assert agent_params['discrete'], "AWACAgent only supports discrete action spaces"
         
         self.replay_buffer = MemoryOptimizedReplayBuffer(100000, 1, float_obs=True)
         self.num_exploration_steps = agent_params['num_exploration_steps']
         self.offline_exploitation = agent_params['offline_exploitation']
+        # visit counts of the stored states, for the coverage metrics and density graphs
+        self.visitation = VisitationCounts(agent_params['visitation_bins'])
 
         self.exploitation_critic = DQNCritic(agent_params, self.optimizer_spec)
         self.exploration_critic = DQNCritic(agent_params, self.optimizer_spec)
         
-        self.exploration_model = RNDModel(agent_params, self.optimizer_spec)
+        self.exploration_model = RNDModel(agent_params, self.optimizer_spec, normalize=normalize_rnd, rnd_gamma=rnd_gamma)
         self.explore_weight_schedule = agent_params['explore_weight_schedule']
         self.exploit_weight_schedule = agent_params['exploit_weight_schedule']
         
@@ -37,106 +41,72 @@ class AWACAgent(DQNAgent):
             self.agent_params['size'],
             self.agent_params['discrete'],
             self.agent_params['learning_rate'],
-            self.agent_params['awac_lambda'],
+            lambda_awac=self.agent_params['awac_lambda'],
         )
 
         self.exploit_rew_shift = agent_params['exploit_rew_shift']
         self.exploit_rew_scale = agent_params['exploit_rew_scale']
         self.eps = agent_params['eps']
 
-        self.running_rnd_rew_std = 1
-        self.normalize_rnd = normalize_rnd
-        self.rnd_gamma = rnd_gamma
-
-    def get_qvals(self, critic, obs, action):
-        # get q-value for a given critic, obs, and action
-        return q_value
-
-    def estimate_advantage(self, ob_no, ac_na, re_n, next_ob_no, terminal_n, n_actions=10):
-        # TODO: Calculate and return the advantage (n sample estimate) 
-        # TODO convert to torch tensors
-
-        # HINT: store computed values in the provided vals list. You will use the average of this list for calculating the advantage.
-        vals = []
-        # TODO: get action distribution for current obs, you will use this for the value function estimate
-        dist = None
-        # TODO Calculate Value Function Estimate given current observation
-        # HINT: You may find it helpful to utilze get_qvals defined above
-        if self.agent_params['discrete']:
-            for i in range(self.agent_params['ac_dim']):
-                pass
-        else:
-            
-            for _ in range(n_actions):
-                pass
-        v_pi = None
+    def estimate_advantage(self, ob_no, ac_na, re_n, next_ob_no, terminal_n):
+        ob_no = ptu.from_numpy(ob_no)
+        ac_na = ptu.from_numpy(ac_na)
+
+        with torch.no_grad():
+            # action distribution for current obs, used for the value function estimate
+            dist = self.awac_actor(ob_no)
 
-        # TODO Calculate Q-Values
-        q_vals = None
-        # TODO Calculate the Advantage using q_vals and v_pi  
-        return None
+            # Value Function Estimate: exact expectation of the q-values under the policy
+            qa_values = self.exploitation_critic.q_net(ob_no)
+            v_pi = (dist.probs * qa_values).sum(dim=-1)
+            q_vals = torch.gather(qa_values, 1, ac_na.long().unsqueeze(1)).squeeze(1)
+
+        return q_vals - v_pi
 
     def train(self, ob_no, ac_na, re_n, next_ob_no, terminal_n):
         log = {}
 
         if self.t > self.num_exploration_steps:
-            # TODO: After exploration is over, set the actor to optimize the extrinsic critic
-            #HINT: Look at method ArgMaxPolicy.set_critic
+            # After exploration is over, the actor optimizes the extrinsic critic
+            self.actor.set_critic(self.exploitation_critic)
 
         if (self.t > self.learning_starts
                 and self.t % self.learning_freq == 0
                 and self.replay_buffer.can_sample(self.batch_size)
         ):
-            # TODO: Get Reward Weights
-            # Get the current explore reward weight and exploit reward weight
-            #       using the schedule's passed in (see __init__)
-            # COMMENT: Until part 3, explore_weight = 1, and exploit_weight = 0
-            explore_weight = None
-            exploit_weight = None
-
-
-            # TODO: Run Exploration Model #
-            # Evaluate the exploration model on s to get the exploration bonus
-            # HINT: Normalize the exploration bonus, as RND values vary highly in magnitude
-            expl_bonus = None
-
-            # TODO: Reward Calculations #
-            # Calculate mixed rewards, which will be passed into the exploration critic
-            # HINT: See doc for definition of mixed_reward
-            mixed_reward = None
-
-            # TODO: Calculate the environment reward
-            # HINT: For part 1, env_reward is just 're_n'
-            #       After this, env_reward is 're_n' shifted by self.exploit_rew_shift,
-            #       and scaled by self.exploit_rew_scale
-            env_reward = None
-
-            # TODO: Update Critics And Exploration Model #
-            # 1): Update the exploration model (based off s')
-            # 2): Update the exploration critic (based off mixed_reward)
-            # 3): Update the exploitation critic (based off env_reward)
-            expl_model_loss = None
-            exploration_critic_loss = None
-            exploitation_critic_loss = None
-
-            # TODO: update actor
-            # 1): Estimate the advantage
-            # 2): Calculate the awac actor loss
-            advantage = None
-            actor_loss = None
-
-            # TODO: Update Target Networks #
+            # Get Reward Weights
+            explore_weight = self.explore_weight_schedule.value(self.t)
+            exploit_weight = self.exploit_weight_schedule.value(self.t)
+
+            # Run Exploration Model #
+            # one stacked RND forward gives the bonus (normalized on the device,
+            # RND values vary highly in magnitude) and updates the predictor
+            expl_bonus, expl_model_loss = self.exploration_model.bonus_and_update(next_ob_no)
+
+            # Reward Calculations #
+            mixed_reward = explore_weight * expl_bonus + exploit_weight * ptu.from_numpy(re_n)
+            env_reward = (re_n + self.exploit_rew_shift) * self.exploit_rew_scale
+
+            # Update Critics And Exploration Model #
+            exploration_critic_loss = self.exploration_critic.update(
+                ob_no, ac_na, next_ob_no, mixed_reward, terminal_n)
+            exploitation_critic_loss = self.exploitation_critic.update(
+                ob_no, ac_na, next_ob_no, env_reward, terminal_n)
+
+            # update actor
+            advantage = self.estimate_advantage(ob_no, ac_na, re_n, next_ob_no, terminal_n)
+            actor_loss = self.awac_actor.update(ob_no, ac_na, advantage)
+
+            # Target Networks #
             if self.num_param_updates % self.target_update_freq == 0:
-                #  Update the exploitation and exploration target networks
-                pass
+                self.exploitation_critic.update_target_network()
+                self.exploration_critic.update_target_network()
 
             # Logging #
             log['Exploration Critic Loss'] = exploration_critic_loss['Training Loss']
             log['Exploitation Critic Loss'] = exploitation_critic_loss['Training Loss']
             log['Exploration Model Loss'] = expl_model_loss
-
-            # Uncomment these lines after completing awac
-            # log['Actor Loss'] = actor_loss
+            log['Actor Loss'] = actor_loss
 
             self.num_param_updates += 1
 
@@ -153,6 +123,7 @@ class AWACAgent(DQNAgent):
         """
         if (not self.offline_exploitation) or (self.t <= self.num_exploration_steps):
             self.replay_buffer_idx = self.replay_buffer.store_frame(self.last_obs)
+            self.visitation.add(self.last_obs)
 
         perform_random_action = np.random.random() < self.eps or self.t < self.learning_starts
 
@@ -1,3 +1,5 @@
+import os
+
 import numpy as np
 import pdb
 
@@ -19,6 +21,8 @@ class DQNAgent(object):
         self.learning_starts = agent_params['learning_starts']
         self.learning_freq = agent_params['learning_freq']
         self.target_update_freq = agent_params['target_update_freq']
+        self.gamma = agent_params['gamma']
+        self.n_step = agent_params['n_step']
 
         self.replay_buffer_idx = None
         self.exploration = agent_params['exploration_schedule']
@@ -29,10 +33,22 @@ class DQNAgent(object):
 
         lander = agent_params['env_name'].startswith('LunarLander')
         self.replay_buffer = MemoryOptimizedReplayBuffer(
-            agent_params['replay_buffer_size'], agent_params['frame_history_len'], lander=lander)
+            agent_params['replay_buffer_size'], agent_params['frame_history_len'], lander=lander,
+            storage_dir=self.replay_storage_dir('dqn'), compressed=agent_params['compress_replay'],
+            channels_first=agent_params['channels_first'])
         self.t = 0
         self.num_param_updates = 0
 
+    def replay_storage_dir(self, name):
+        """Directory of the memory-mapped replay buffer `name`, or None if replay is kept in memory.
+
+        Every buffer gets its own subdirectory of replay_storage_dir, so buffers
+        created by subclasses never share files or counters with this one.
+        """
+        if self.agent_params['replay_storage_dir'] is None:
+            return None
+        return os.path.join(self.agent_params['replay_storage_dir'], name)
+
     def add_to_replay_buffer(self, paths):
         pass
 
@@ -50,7 +66,9 @@ class DQNAgent(object):
     ####################################
 
     def sample(self, batch_size):
-        if self.replay_buffer.can_sample(self.batch_size):
+        if self.n_step > 1 and self.replay_buffer.can_sample(self.batch_size, self.n_step):
+            return self.replay_buffer.sample_n_step(batch_size, self.n_step, self.gamma)
+        elif self.n_step == 1 and self.replay_buffer.can_sample(self.batch_size):
             return self.replay_buffer.sample(batch_size)
         else:
             return [],[],[],[],[]
@@ -2,27 +2,58 @@ from collections import OrderedDict
 
 from rob831.hw4_part2.critics.dqn_critic import DQNCritic
 from rob831.hw4_part2.critics.cql_critic import CQLCritic
+from rob831.hw4_part2.critics.shared_dqn_critic import SharedTrunkDQNCritic
 from rob831.hw4_part2.infrastructure.replay_buffer import ReplayBuffer
 from rob831.hw4_part2.infrastructure.utils import *
+from rob831.hw4_part2.infrastructure import pytorch_util as ptu
 from rob831.hw4_part2.policies.argmax_policy import ArgMaxPolicy
 from rob831.hw4_part2.infrastructure.dqn_utils import MemoryOptimizedReplayBuffer
 from rob831.hw4_part2.exploration.rnd_model import RNDModel
 from .dqn_agent import DQNAgent
 import numpy as np
+import torch
 
 
 class ExplorationOrExploitationAgent(DQNAgent):
     def __init__(self, env, agent_params, normalize_rnd=True, rnd_gamma=0.99):
         super(ExplorationOrExploitationAgent, self).__init__(env, agent_params)
         
-        self.replay_buffer = MemoryOptimizedReplayBuffer(100000, 1, float_obs=True)
+        self.replay_buffer = MemoryOptimizedReplayBuffer(
+            100000, 1, float_obs=True, storage_dir=self.replay_storage_dir('explore_or_exploit'),
+            compressed=agent_params['compress_replay'])
         self.num_exploration_steps = agent_params['num_exploration_steps']
         self.offline_exploitation = agent_params['offline_exploitation']
-
-        self.exploitation_critic = DQNCritic(agent_params, self.optimizer_spec)
-        self.exploration_critic = DQNCritic(agent_params, self.optimizer_spec)
+        # hand the exploration data to later exploitation runs through an on-disk dataset
+        self.export_dataset_dir = agent_params['export_dataset_dir']
+        # visit counts of the stored states, for the coverage metrics and density graphs
+        self.visitation = VisitationCounts(agent_params['visitation_bins'])
+        if agent_params['load_dataset_dir'] is not None:
+            # the dataset stands in for exploration: exploit it offline from the
+            # first step, without storing (and overwriting it with) new frames
+            assert self.offline_exploitation, "load_dataset_dir requires offline_exploitation"
+            self.replay_buffer.load_dataset(agent_params['load_dataset_dir'])
+            self.visitation.add_batch(self.replay_buffer.obs[:self.replay_buffer.num_in_buffer])
+            self.t = self.num_exploration_steps + 1
+
+        self.shared_critic = agent_params['shared_critic']
+        if self.shared_critic:
+            # one trunk, head 0 learns the mixed reward and head 1 the env reward
+            cql_heads = (1,) if agent_params['cql_alpha'] > 0 else ()
+            self.critic = SharedTrunkDQNCritic(
+                agent_params, self.optimizer_spec, n_heads=2, cql_heads=cql_heads)
+            self.exploration_critic = self.critic.head(0)
+            self.exploitation_critic = self.critic.head(1)
+        else:
+            if agent_params['cql_alpha'] > 0:
+                self.exploitation_critic = CQLCritic(agent_params, self.optimizer_spec)
+            else:
+                self.exploitation_critic = DQNCritic(agent_params, self.optimizer_spec)
+            self.exploration_critic = DQNCritic(agent_params, self.optimizer_spec)
         
-        self.exploration_model = RNDModel(agent_params, self.optimizer_spec)
+        self.exploration_model = RNDModel(agent_params, self.optimizer_spec, normalize=normalize_rnd, rnd_gamma=rnd_gamma)
+        # the RND bonus is a one-step reward of next_ob_no, which n-step batches put n steps ahead
+        assert self.n_step == 1 or not (agent_params['use_rnd'] or agent_params['unsupervised_exploration']), \
+            "n_step > 1 is only supported without an exploration bonus"
         self.explore_weight_schedule = agent_params['explore_weight_schedule']
         self.exploit_weight_schedule = agent_params['exploit_weight_schedule']
         
@@ -32,64 +63,56 @@ class ExplorationOrExploitationAgent(DQNAgent):
         self.exploit_rew_scale = agent_params['exploit_rew_scale']
         self.eps = agent_params['eps']
 
-        self.running_rnd_rew_std = 1
-        self.normalize_rnd = normalize_rnd
-        self.rnd_gamma = rnd_gamma
-
     def train(self, ob_no, ac_na, re_n, next_ob_no, terminal_n):
         log = {}
 
         if self.t > self.num_exploration_steps:
-            # TODO: After exploration is over, set the actor to optimize the extrinsic critic
-            #HINT: Look at method ArgMaxPolicy.set_critic
+            # After exploration is over, the actor optimizes the extrinsic critic
+            self.actor.set_critic(self.exploitation_critic)
 
         if (self.t > self.learning_starts
                 and self.t % self.learning_freq == 0
-                and self.replay_buffer.can_sample(self.batch_size)
+                and self.replay_buffer.can_sample(self.batch_size, self.n_step)
         ):
 
             # Get Reward Weights
-            # TODO: Get the current explore reward weight and exploit reward weight
-            #       using the schedule's passed in (see __init__)
-            # COMMENT: you can simply use explore_weight = 1, and exploit_weight = 0
-            explore_weight = None
-            exploit_weight = None
+            explore_weight = self.explore_weight_schedule.value(self.t)
+            exploit_weight = self.exploit_weight_schedule.value(self.t)
 
             # Run Exploration Model #
-            # TODO: Evaluate the exploration model on s to get the exploration bonus
-            # HINT: Normalize the exploration bonus, as RND values vary highly in magnitude.
-            # HINT: Normalize using self.running_rnd_rew_std, and keep an exponential moving average
-            # of self.running_rnd_rew_std using self.rnd_gamma.
-            expl_bonus = None
+            # one stacked RND forward gives the bonus (normalized on the device,
+            # RND values vary highly in magnitude) and updates the predictor
+            expl_bonus, expl_model_loss = self.exploration_model.bonus_and_update(next_ob_no)
 
             # Reward Calculations #
-            # TODO: Calculate mixed rewards, which will be passed into the exploration critic
-            # HINT: See doc for definition of mixed_reward
-            mixed_reward = None
-
-            # TODO: Calculate the environment reward
-            # HINT: For part 1, env_reward is just 're_n'
-            #       After this, env_reward is 're_n' shifted by self.exploit_rew_shift,
-            #       and scaled by self.exploit_rew_scale
-            env_reward = None
+            mixed_reward = explore_weight * expl_bonus + exploit_weight * ptu.from_numpy(re_n)
+            env_reward = (re_n + self.exploit_rew_shift) * self.exploit_rew_scale
 
             # Update Critics And Exploration Model #
-
-            # TODO 1): Update the exploration model (based off s')
-            # TODO 2): Update the exploration critic (based off mixed_reward)
-            # TODO 3): Update the exploitation critic (based off env_reward)
-            expl_model_loss = None
-            exploration_critic_loss = None
-            exploitation_critic_loss = None
+            if self.shared_critic:
+                exploration_critic_loss, exploitation_critic_loss = self.critic.update(
+                    ob_no, ac_na, next_ob_no, torch.stack([mixed_reward, ptu.from_numpy(env_reward)], dim=1), terminal_n)
+            else:
+                exploration_critic_loss = self.exploration_critic.update(
+                    ob_no, ac_na, next_ob_no, mixed_reward, terminal_n)
+                exploitation_critic_loss = self.exploitation_critic.update(
+                    ob_no, ac_na, next_ob_no, env_reward, terminal_n)
 
             # Target Networks #
             if self.num_param_updates % self.target_update_freq == 0:
-                # TODO: Update the exploitation and exploration target networks
+                if self.shared_critic:
+                    self.critic.update_target_network()
+                else:
+                    self.exploitation_critic.update_target_network()
+                    self.exploration_critic.update_target_network()
 
             # Logging #
             log['Exploitation Critic Loss'] = exploitation_critic_loss['Training Loss']
             log['Exploration Critic Loss'] = exploration_critic_loss['Training Loss']
             log['Exploration Model Loss'] = expl_model_loss
+            for key in ('CQL Loss', 'Data q-values', 'OOD q-values'):
+                if key in exploitation_critic_loss:
+                    log[key] = exploitation_critic_loss[key]
 
             self.num_param_updates += 1
 
@@ -106,6 +129,7 @@ class ExplorationOrExploitationAgent(DQNAgent):
         """
         if (not self.offline_exploitation) or (self.t <= self.num_exploration_steps):
             self.replay_buffer_idx = self.replay_buffer.store_frame(self.last_obs)
+            self.visitation.add(self.last_obs)
 
         perform_random_action = np.random.random() < self.eps or self.t < self.learning_starts
 
@@ -121,5 +145,8 @@ class ExplorationOrExploitationAgent(DQNAgent):
         if (not self.offline_exploitation) or (self.t <= self.num_exploration_steps):
             self.replay_buffer.store_effect(self.replay_buffer_idx, action, reward, done)
 
+        if self.t == self.num_exploration_steps and self.export_dataset_dir is not None:
+            self.replay_buffer.export_dataset(self.export_dataset_dir)
+
         if done:
             self.last_obs = self.env.reset()
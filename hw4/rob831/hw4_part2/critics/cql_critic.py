@@ -6,6 +6,7 @@ from torch import nn
 import pdb
 
 from rob831.hw4_part2.infrastructure import pytorch_util as ptu
+from rob831.hw4_part2.infrastructure import param_sync
 
 
 class CQLCritic(BaseCritic):
@@ -24,6 +25,7 @@ class CQLCritic(BaseCritic):
         self.double_q = hparams['double_q']
         self.grad_norm_clipping = hparams['grad_norm_clipping']
         self.gamma = hparams['gamma']
+        self.n_step = hparams['n_step']
 
         self.optimizer_spec = optimizer_spec
         network_initializer = hparams['q_func']
@@ -44,6 +46,25 @@ class CQLCritic(BaseCritic):
 
     def dqn_loss(self, ob_no, ac_na, next_ob_no, reward_n, terminal_n):
         """ Implement DQN Loss """
+        batch_size = ob_no.shape[0]
+        if self.double_q:
+            # one online forward over s_t and s_t+1; the s_t+1 half only selects actions
+            qa_values = self.q_net(torch.cat([ob_no, next_ob_no], dim=0))
+            qa_t_values, qa_tp1_online = qa_values[:batch_size], qa_values[batch_size:].detach()
+        else:
+            qa_t_values = self.q_net(ob_no)
+        q_t_values = torch.gather(qa_t_values, 1, ac_na.unsqueeze(1)).squeeze(1)
+
+        with torch.no_grad():
+            qa_tp1_values = self.q_net_target(next_ob_no)
+            if self.double_q:
+                next_actions = qa_tp1_online.argmax(dim=1)
+                q_tp1 = torch.gather(qa_tp1_values, 1, next_actions.unsqueeze(1)).squeeze(1)
+            else:
+                q_tp1, _ = qa_tp1_values.max(dim=1)
+            target = reward_n + self.gamma ** self.n_step * q_tp1 * (1 - terminal_n)
+
+        loss = self.loss(q_t_values, target)
 
         return loss, qa_t_values, q_t_values
 
@@ -64,10 +85,10 @@ class CQLCritic(BaseCritic):
             returns:
                 nothing
         """
-        ob_no = ptu.from_numpy(ob_no)
+        ob_no = ptu.from_numpy_obs(ob_no)
         ac_na = ptu.from_numpy(ac_na).to(torch.long)
-        next_ob_no = ptu.from_numpy(next_ob_no)
-        reward_n = ptu.from_numpy(reward_n)
+        next_ob_no = ptu.from_numpy_obs(next_ob_no)
+        reward_n = ptu.as_tensor(reward_n)
         terminal_n = ptu.from_numpy(terminal_n)
 
         # Compute the DQN Loss 
@@ -76,29 +97,30 @@ class CQLCritic(BaseCritic):
             )
         
         # CQL Implementation
-        # TODO: Implement CQL as described in the pdf and paper
-        # Hint: After calculating cql_loss, augment the loss appropriately
-        q_t_logsumexp = None
-        cql_loss = None
+        # the regularizer reuses qa_t_values from the DQN forward, so q_net runs once
+        q_t_logsumexp = torch.logsumexp(qa_t_values, dim=1)
+        cql_loss = (q_t_logsumexp - q_t_values).mean()
+        total_loss = loss + self.cql_alpha * cql_loss
+
+        self.optimizer.zero_grad()
+        total_loss.backward()
+        utils.clip_grad_value_(self.q_net.parameters(), self.grad_norm_clipping)
+        self.optimizer.step()
+
+        # logging scalars stay on the device; the trainer syncs them when it logs
+        info = {'Training Loss': loss.detach()}
+        info['CQL Loss'] = cql_loss.detach()
+        info['Data q-values'] = q_t_values.detach().mean()
+        info['OOD q-values'] = q_t_logsumexp.detach().mean()
 
-        info = {'Training Loss': ptu.to_numpy(loss)}
-
-        # TODO: Uncomment these lines after implementing CQL
-        # info['CQL Loss'] = ptu.to_numpy(cql_loss)
-        # info['Data q-values'] = ptu.to_numpy(q_t_values).mean()
-        # info['OOD q-values'] = ptu.to_numpy(q_t_logsumexp).mean()
-        
         self.learning_rate_scheduler.step()
 
         return info
 
     def update_target_network(self):
-        for target_param, param in zip(
-                self.q_net_target.parameters(), self.q_net.parameters()
-        ):
-            target_param.data.copy_(param.data)
+        param_sync.hard_update(self.q_net_target, self.q_net)
 
     def qa_values(self, obs):
-        obs = ptu.from_numpy(obs)
+        obs = ptu.from_numpy_obs(obs)
         qa_values = self.q_net(obs)
         return ptu.to_numpy(qa_values)
@@ -6,6 +6,7 @@ from torch import nn
 import pdb
 
 from rob831.hw4_part2.infrastructure import pytorch_util as ptu
+from rob831.hw4_part2.infrastructure import param_sync
 
 
 class DQNCritic(BaseCritic):
@@ -24,6 +25,7 @@ class DQNCritic(BaseCritic):
         self.double_q = hparams['double_q']
         self.grad_norm_clipping = hparams['grad_norm_clipping']
         self.gamma = hparams['gamma']
+        self.n_step = hparams['n_step']
 
         self.optimizer_spec = optimizer_spec
         network_initializer = hparams['q_func']
@@ -54,27 +56,35 @@ class DQNCritic(BaseCritic):
                     the reward for each timestep
                 terminal_n: length: sum_of_path_lengths. Each element in terminal_n is either 1 if the episode ended
                     at that timestep of 0 if the episode did not end
+                with n_step > 1, reward_n holds the discounted n-step returns, next_ob_no the observations n steps
+                    later and terminal_n whether the episode ended within those n steps
             returns:
                 nothing
         """
-        ob_no = ptu.from_numpy(ob_no)
+        ob_no = ptu.from_numpy_obs(ob_no)
         ac_na = ptu.from_numpy(ac_na).to(torch.long)
-        next_ob_no = ptu.from_numpy(next_ob_no)
-        reward_n = ptu.from_numpy(reward_n)
+        next_ob_no = ptu.from_numpy_obs(next_ob_no)
+        reward_n = ptu.as_tensor(reward_n)
         terminal_n = ptu.from_numpy(terminal_n)
 
-        qa_t_values = self.q_net(ob_no)
-        q_t_values = torch.gather(qa_t_values, 1, ac_na.unsqueeze(1)).squeeze(1)
-        qa_tp1_values = self.q_net_target(next_ob_no)
-
+        batch_size = ob_no.shape[0]
         if self.double_q:
-            next_actions = self.q_net(next_ob_no).argmax(dim=1)
-            q_tp1 = torch.gather(qa_tp1_values, 1, next_actions.unsqueeze(1)).squeeze(1)
+            # one online forward over s_t and s_t+1; the s_t+1 half only selects actions
+            qa_values = self.q_net(torch.cat([ob_no, next_ob_no], dim=0))
+            qa_t_values, qa_tp1_online = qa_values[:batch_size], qa_values[batch_size:].detach()
         else:
-            q_tp1, _ = qa_tp1_values.max(dim=1)
+            qa_t_values = self.q_net(ob_no)
+        q_t_values = torch.gather(qa_t_values, 1, ac_na.unsqueeze(1)).squeeze(1)
+
+        with torch.no_grad():
+            qa_tp1_values = self.q_net_target(next_ob_no)
+            if self.double_q:
+                next_actions = qa_tp1_online.argmax(dim=1)
+                q_tp1 = torch.gather(qa_tp1_values, 1, next_actions.unsqueeze(1)).squeeze(1)
+            else:
+                q_tp1, _ = qa_tp1_values.max(dim=1)
+            target = reward_n + self.gamma ** self.n_step * q_tp1 * (1 - terminal_n)
 
-        target = reward_n + self.gamma * q_tp1 * (1 - terminal_n)
-        target = target.detach()
         loss = self.loss(q_t_values, target)
     
         self.optimizer.zero_grad()
@@ -84,18 +94,16 @@ class DQNCritic(BaseCritic):
         
         self.learning_rate_scheduler.step()
 
-        return {'Training Loss': ptu.to_numpy(loss)}
+        # the loss stays on the device; the trainer syncs it when it logs
+        return {'Training Loss': loss.detach()}
 
     ####################################
     ####################################
 
     def update_target_network(self):
-        for target_param, param in zip(
-                self.q_net_target.parameters(), self.q_net.parameters()
-        ):
-            target_param.data.copy_(param.data)
+        param_sync.hard_update(self.q_net_target, self.q_net)
 
     def qa_values(self, obs):
-        obs = ptu.from_numpy(obs)
+        obs = ptu.from_numpy_obs(obs)
         qa_values = self.q_net(obs)
         return ptu.to_numpy(qa_values)
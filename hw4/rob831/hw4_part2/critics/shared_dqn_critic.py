@@ -0,0 +1,160 @@
+from .base_critic import BaseCritic
+import torch
+import torch.optim as optim
+from torch.nn import utils
+from torch import nn
+from torch.nn import functional as F
+
+from rob831.hw4_part2.infrastructure import pytorch_util as ptu
+from rob831.hw4_part2.infrastructure import param_sync
+
+
+class SharedTrunkDQNCritic(BaseCritic):
+    """
+        DQN critic with n_heads Q-heads on one shared trunk, e.g. one head for the
+        mixed (exploration) reward and one for the environment reward.
+        The network built by hparams['q_func'] outputs n_heads * ac_dim values, so
+        all heads cost one forward and one backward per batch; the target network
+        has the same layout, so every head keeps its own target.
+        The heads listed in cql_heads are trained like CQLCritic, with the MSE
+        loss and the CQL regularizer weighted by hparams['cql_alpha']; the other
+        heads are trained like DQNCritic, with the Huber loss.
+    """
+
+    def __init__(self, hparams, optimizer_spec, n_heads=2, cql_heads=(), **kwargs):
+        super().__init__(**kwargs)
+        self.env_name = hparams['env_name']
+        self.ob_dim = hparams['ob_dim']
+
+        if isinstance(self.ob_dim, int):
+            self.input_shape = (self.ob_dim,)
+        else:
+            self.input_shape = hparams['input_shape']
+
+        self.ac_dim = hparams['ac_dim']
+        self.n_heads = n_heads
+        self.double_q = hparams['double_q']
+        self.grad_norm_clipping = hparams['grad_norm_clipping']
+        self.gamma = hparams['gamma']
+        self.n_step = hparams['n_step']
+        self.cql_alpha = hparams['cql_alpha']
+        self.cql_heads = list(cql_heads)
+
+        self.optimizer_spec = optimizer_spec
+        network_initializer = hparams['q_func']
+        self.q_net = network_initializer(self.ob_dim, self.n_heads * self.ac_dim)
+        self.q_net_target = network_initializer(self.ob_dim, self.n_heads * self.ac_dim)
+        self.optimizer = self.optimizer_spec.constructor(
+            self.q_net.parameters(),
+            **self.optimizer_spec.optim_kwargs
+        )
+        self.learning_rate_scheduler = optim.lr_scheduler.LambdaLR(
+            self.optimizer,
+            self.optimizer_spec.learning_rate_schedule,
+        )
+        self.q_net.to(ptu.device)
+        self.q_net_target.to(ptu.device)
+        self.mse_heads = torch.zeros(self.n_heads, dtype=torch.bool, device=ptu.device)
+        self.mse_heads[self.cql_heads] = True
+
+    def _heads(self, qa_values):
+        # (batch_size, n_heads * ac_dim) -> (batch_size, n_heads, ac_dim)
+        return qa_values.view(-1, self.n_heads, self.ac_dim)
+
+    def update(self, ob_no, ac_na, next_ob_no, reward_nh, terminal_n):
+        """
+            Update all the heads of the critic on one batch.
+            arguments:
+                as DQNCritic.update, except
+                reward_nh: shape: (batch_size, n_heads), the reward each head is trained on
+            returns:
+                a list with the training loss of every head
+        """
+        ob_no = ptu.from_numpy_obs(ob_no)
+        ac_na = ptu.from_numpy(ac_na).to(torch.long)
+        next_ob_no = ptu.from_numpy_obs(next_ob_no)
+        reward_nh = ptu.as_tensor(reward_nh)
+        terminal_n = ptu.from_numpy(terminal_n)
+
+        batch_size = ob_no.shape[0]
+        if self.double_q:
+            # one online forward over s_t and s_t+1; the s_t+1 half only selects actions
+            qa_values = self._heads(self.q_net(torch.cat([ob_no, next_ob_no], dim=0)))
+            qa_t_values, qa_tp1_online = qa_values[:batch_size], qa_values[batch_size:].detach()
+        else:
+            qa_t_values = self._heads(self.q_net(ob_no))
+        ac_index = ac_na.view(-1, 1, 1).expand(-1, self.n_heads, 1)
+        q_t_values = torch.gather(qa_t_values, 2, ac_index).squeeze(2)
+
+        with torch.no_grad():
+            qa_tp1_values = self._heads(self.q_net_target(next_ob_no))
+            if self.double_q:
+                next_actions = qa_tp1_online.argmax(dim=2, keepdim=True)
+                q_tp1 = torch.gather(qa_tp1_values, 2, next_actions).squeeze(2)
+            else:
+                q_tp1, _ = qa_tp1_values.max(dim=2)
+            target = reward_nh + self.gamma ** self.n_step * q_tp1 * (1 - terminal_n).unsqueeze(1)
+
+        # the loss of each head is the one of the critic it stands in for (MSE
+        # for CQL heads, Huber otherwise); their sum gives every head's outputs
+        # the gradient that critic would get
+        head_losses = torch.where(
+            self.mse_heads,
+            F.mse_loss(q_t_values, target, reduction='none'),
+            F.smooth_l1_loss(q_t_values, target, reduction='none'),
+        ).mean(dim=0)
+        loss = head_losses.sum()
+
+        info = {}
+        if self.cql_heads:
+            # CQL regularizer on the qa_t_values of the same forward
+            q_t_logsumexp = torch.logsumexp(qa_t_values[:, self.cql_heads], dim=2)
+            cql_loss = (q_t_logsumexp - q_t_values[:, self.cql_heads]).mean(dim=0)
+            loss = loss + self.cql_alpha * cql_loss.sum()
+            info['CQL Loss'] = cql_loss.detach()
+            info['Data q-values'] = q_t_values[:, self.cql_heads].detach().mean(dim=0)
+            info['OOD q-values'] = q_t_logsumexp.detach().mean(dim=0)
+
+        self.optimizer.zero_grad()
+        loss.backward()
+        utils.clip_grad_value_(self.q_net.parameters(), self.grad_norm_clipping)
+        self.optimizer.step()
+
+        self.learning_rate_scheduler.step()
+
+        # logging scalars stay on the device; the trainer syncs them when it logs
+        head_losses = head_losses.detach()
+        head_infos = [{'Training Loss': head_losses[i]} for i in range(self.n_heads)]
+        for key, values in info.items():
+            for i, head in enumerate(self.cql_heads):
+                head_infos[head][key] = values[i]
+        return head_infos
+
+    ####################################
+    ####################################
+
+    def update_target_network(self):
+        param_sync.hard_update(self.q_net_target, self.q_net)
+
+    def head_qa_values(self, obs):
+        """Q-values of every head for the observation tensor obs, shape (batch_size, n_heads, ac_dim)"""
+        return self._heads(self.q_net(obs))
+
+    def qa_values(self, obs, head=0):
+        obs = ptu.from_numpy_obs(obs)
+        qa_values = self.head_qa_values(obs)[:, head]
+        return ptu.to_numpy(qa_values)
+
+    def head(self, index):
+        return CriticHead(self, index)
+
+
+class CriticHead(object):
+    """Read-only view of one head of a SharedTrunkDQNCritic, usable by ArgMaxPolicy."""
+
+    def __init__(self, critic, index):
+        self.critic = critic
+        self.index = index
+
+    def qa_values(self, obs):
+        return self.critic.qa_values(obs, head=self.index)
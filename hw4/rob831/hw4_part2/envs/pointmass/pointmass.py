@@ -1,9 +1,12 @@
-import networkx as nx
+import hashlib
+import os
 import scipy.sparse.csgraph
 import numpy as np
 import gym
 import pickle
 
+from rob831.hw4_part2.envs import raster
+
 WALLS = {
     'Small':
         np.array([[0, 0, 0, 0],
@@ -238,6 +241,12 @@ ACT_DICT = {
     4: [1., 0.],
 }
 
+# The distance field and optimal-action table only depend on the maze, so they
+# are computed once per maze and goal and reused across runs.
+ORACLE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'rob831', 'pointmass')
+# Cells of the optimal-action table per unit of the (unnormalized) state.
+ORACLE_RESOLUTION = 10
+
 def resize_walls(walls, factor):
   """Increase the environment by rescaling.
   
@@ -260,6 +269,7 @@ class Pointmass(gym.Env):
   def __init__(self,
                difficulty=0,
                dense_reward=False,
+               headless=False,
                ):
     """Initialize the point environment.
 
@@ -268,6 +278,8 @@ class Pointmass(gym.Env):
       resize_factor: (int) Scale the map by this factor.
       action_noise: (float) Standard deviation of noise to add to actions. Use 0
         to add no noise.
+      headless: (bool) Only record the trajectory of each episode instead of
+        plotting it on every reset; plot_trajectory draws it when asked.
     """
     import matplotlib
     matplotlib.use('Agg')
@@ -314,7 +326,6 @@ class Pointmass(gym.Env):
     else:
       self._walls = WALLS[walls]
     (height, width) = self._walls.shape
-    self._apsp = self._compute_apsp(self._walls)
 
     self._height = height
     self._width = width
@@ -328,8 +339,17 @@ class Pointmass(gym.Env):
     self.num_actions = 5
     self.epsilon = resize_factor
     self.action_noise = 0.5
+
+    self._goal_cell = tuple(int(x) for x in self._discretize_state(self.fixed_goal))
+    self._distance_fields = {}
+    self._optimal_actions = self._load_oracle()
+    self._raster = self._make_raster()
     
-    self.obs_vec = []
+    self.headless = headless
+    # normalized observations of the current episode, grown if an episode
+    # runs past max_episode_steps
+    self._obs_buffer = np.empty((self.max_episode_steps + 1, self.obs_dim))
+    self._obs_len = 0
     self.last_trajectory = None
     self.difficulty = difficulty
 
@@ -343,16 +363,31 @@ class Pointmass(gym.Env):
     if seed: self.seed(seed)
         
     if len(self.obs_vec) > 0:
-      self.last_trajectory = self.plot_trajectory()
+      self.last_trajectory = self.obs_vec.copy()
+      if not self.headless:
+        self.plot_trajectory()
     
-    self.plt.clf()
+    if not self.headless:
+      self.plt.clf()
+    self._raster.reset()
     self.timesteps_left = self.max_episode_steps
     
-    self.obs_vec = [self._normalize_obs(self.fixed_start.copy())]
+    self._obs_len = 0
+    self._record_obs(self._normalize_obs(self.fixed_start.copy()))
     self.state = self.fixed_start.copy()
     self.num_runs += 1
     return self._normalize_obs(self.state.copy())
 
+  @property
+  def obs_vec(self):
+    return self._obs_buffer[:self._obs_len]
+
+  def _record_obs(self, obs):
+    if self._obs_len == len(self._obs_buffer):
+      self._obs_buffer = np.concatenate([self._obs_buffer, np.empty_like(self._obs_buffer)])
+    self._obs_buffer[self._obs_len] = obs
+    self._obs_len += 1
+
   def set_logdir(self, path):
     self.traj_filepath = path + 'last_traj.png'
     
@@ -361,8 +396,7 @@ class Pointmass(gym.Env):
     
     Note: This distance is *not* used for training."""
     (i1, j1) = self._discretize_state(obs.copy())
-    (i2, j2) = self._discretize_state(goal.copy())
-    return self._apsp[i1, j1, i2, j2]
+    return self._distance_field(self._discretize_state(goal.copy()))[i1, j1]
 
   def simulate_step(self, state, action):
     num_substeps = 10
@@ -377,21 +411,37 @@ class Pointmass(gym.Env):
           state = new_state
     return state
 
+  def _simulate_steps(self, states, actions):
+    """Move a batch of (N, 2) states by (N, 2) actions in 10 substeps; along
+    each axis a substep is skipped if it would end in a wall or off the map."""
+    num_substeps = 10
+    dt = 1.0 / num_substeps
+    states = states.copy()
+    for _ in range(num_substeps):
+      for axis in range(states.shape[1]):
+        new_states = states.copy()
+        new_states[:, axis] += dt * actions[:, axis]
+        free = ~self._are_blocked(new_states)
+        states[free] = new_states[free]
+    return states
+
+  def _are_blocked(self, states):
+    """_is_blocked for a batch of (N, 2) states, as one lookup in _walls."""
+    high = np.array([self._height, self._width])
+    inside = np.all((states >= 0) & (states <= high), axis=1)
+    cells = np.floor(np.clip(states, 0, high)).astype(int)
+    # Round down to the nearest cell if at the boundary.
+    cells = np.minimum(cells, high - 1)
+    return ~inside | (self._walls[cells[:, 0], cells[:, 1]] == 1)
+
   def get_optimal_action(self, state):
     state = self._unnormalize_obs(state)
-    best_action = 0
-    best_dist = np.inf
-    for i in range(self.num_actions):
-      action = np.array(ACT_DICT[i])
-      s_prime = self.simulate_step(state, action)
-      dist = self._get_distance(s_prime, self.fixed_goal)
-      if dist < best_dist:
-        best_dist = dist
-        best_action = i
-    return best_action
+    (i, j) = np.floor(state * ORACLE_RESOLUTION).astype(int)
+    (height, width) = self._optimal_actions.shape
+    return int(self._optimal_actions[min(max(i, 0), height - 1), min(max(j, 0), width - 1)])
 
   def _discretize_state(self, state, resolution=1.0):
-    (i, j) = np.floor(resolution * state).astype(np.int)
+    (i, j) = np.floor(resolution * state).astype(int)
     # Round down to the nearest cell if at the boundary.
     if i == self._height:
       i -= 1
@@ -412,7 +462,8 @@ class Pointmass(gym.Env):
     ])
   
   def _is_blocked(self, state):
-    if not self.observation_space.contains(state):
+    # same test as observation_space.contains, without its per-call overhead
+    if not (0 <= state[0] <= self._height and 0 <= state[1] <= self._width):
       return True
     (i, j) = self._discretize_state(state)
     return (self._walls[i, j] == 1)
@@ -430,7 +481,7 @@ class Pointmass(gym.Env):
     dist = np.linalg.norm(self.state - self.fixed_goal)
     done = (dist < self.epsilon) or (self.timesteps_left == 0)
     ns = self._normalize_obs(self.state.copy())
-    self.obs_vec.append(ns.copy())
+    self._record_obs(ns)
     
     if self.dense_reward:
       reward = -dist
@@ -447,52 +498,103 @@ class Pointmass(gym.Env):
   def goal(self):
     return self._normalize_obs(self.fixed_goal.copy())
 
-  def _compute_apsp(self, walls):
-    (height, width) = walls.shape
-    g = nx.Graph()
-    # Add all the nodes
-    for i in range(height):
-      for j in range(width):
-        if walls[i, j] == 0:
-          g.add_node((i, j))
-
-    # Add all the edges
-    for i in range(height):
-      for j in range(width):
-        for di in [-1, 0, 1]:
-          for dj in [-1, 0, 1]:
-            if di == dj == 0: continue  # Don't add self loops
-            if i + di < 0 or i + di > height - 1: continue  # No cell here
-            if j + dj < 0 or j + dj > width - 1: continue  # No cell here
-            if walls[i, j] == 1: continue  # Don't add edges to walls
-            if walls[i + di, j + dj] == 1: continue  # Don't add edges to walls
-            g.add_edge((i, j), (i + di, j + dj))
-
-    # dist[i, j, k, l] is path from (i, j) -> (k, l)
-    dist = np.full((height, width, height, width), np.float('inf'))
-    for ((i1, j1), dist_dict) in nx.shortest_path_length(g):
-      for ((i2, j2), d) in dist_dict.items():
-        dist[i1, j1, i2, j2] = d
-
-    return dist
-
-  def render(self, mode=None):
-    self.plot_walls()
+  def _distance_field(self, goal_cell):
+    """Shortest path distance from every cell to goal_cell, inf if unreachable."""
+    goal_cell = tuple(int(x) for x in goal_cell)
+    if goal_cell not in self._distance_fields:
+      self._distance_fields[goal_cell] = self._compute_distance_field(self._walls, goal_cell)
+    return self._distance_fields[goal_cell]
 
-    # current and end
-    self.plt.plot(self.fixed_goal[0], self.fixed_goal[1], 'go')
-    self.plt.plot(self.state[0], self.state[1], 'ko')
-    self.plt.pause(0.1)
+  def _compute_distance_field(self, walls, goal_cell):
+    """Single-source BFS from goal_cell over the 8-connected free cells.
 
-    img = np.frombuffer(self.fig.canvas.tostring_rgb(), dtype=np.uint8)
-    img = img.reshape(self.fig.canvas.get_width_height()[::-1] + (3,))
-    return img
+    The graph is undirected, so the distance from the goal is also the
+    distance to it."""
+    (height, width) = walls.shape
+    free = (walls == 0)
+    index = np.arange(height * width).reshape(height, width)
+    rows, cols = [], []
+    for di in [-1, 0, 1]:
+      for dj in [-1, 0, 1]:
+        if di == dj == 0: continue  # Don't add self loops
+        # cells (i, j) whose neighbour (i + di, j + dj) is on the grid
+        src = (slice(max(-di, 0), height - max(di, 0)), slice(max(-dj, 0), width - max(dj, 0)))
+        dst = (slice(max(di, 0), height + min(di, 0)), slice(max(dj, 0), width + min(dj, 0)))
+        edge = free[src] & free[dst]  # Don't add edges to walls
+        rows.append(index[src][edge])
+        cols.append(index[dst][edge])
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    graph = scipy.sparse.coo_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(height * width, height * width)).tocsr()
+    dist = scipy.sparse.csgraph.shortest_path(
+        graph, unweighted=True, indices=index[goal_cell])
+    return dist.reshape(height, width)
+
+  def _compute_optimal_actions(self):
+    """Optimal action at the centre of every cell of a grid with
+    ORACLE_RESOLUTION cells per unit: the action whose simulated next state is
+    closest to the goal, ties going to the lowest action as before."""
+    (height, width) = (self._height * ORACLE_RESOLUTION, self._width * ORACLE_RESOLUTION)
+    (i, j) = np.meshgrid(np.arange(height), np.arange(width), indexing='ij')
+    states = (np.stack([i.ravel(), j.ravel()], axis=1) + 0.5) / ORACLE_RESOLUTION
+    goal_dist = self._distance_field(self._goal_cell)
+    dists = np.empty((len(states), self.num_actions))
+    for a in range(self.num_actions):
+      actions = np.tile(ACT_DICT[a], (len(states), 1))
+      cells = np.floor(self._simulate_steps(states, actions)).astype(int)
+      cells = np.minimum(cells, np.array([self._height, self._width]) - 1)
+      dists[:, a] = goal_dist[cells[:, 0], cells[:, 1]]
+    return dists.argmin(axis=1).astype(np.int8).reshape(height, width)
+
+  def _load_oracle(self):
+    """Optimal-action table for this maze and goal, cached on disk."""
+    key = hashlib.sha1()
+    key.update(np.ascontiguousarray(self._walls, dtype=np.int8).tobytes())
+    key.update(np.array(self._walls.shape + self._goal_cell + (ORACLE_RESOLUTION,)).tobytes())
+    path = os.path.join(ORACLE_CACHE_DIR, key.hexdigest() + '.npz')
+    if os.path.exists(path):
+      with np.load(path) as cached:
+        self._distance_fields[self._goal_cell] = cached['distance']
+        return cached['optimal_actions']
+
+    optimal_actions = self._compute_optimal_actions()
+    try:
+      os.makedirs(ORACLE_CACHE_DIR, exist_ok=True)
+      # write to a temporary file first so concurrent runs never read a partial cache
+      tmp_path = '{}.{}.npz'.format(path[:-len('.npz')], os.getpid())
+      np.savez(tmp_path, distance=self._distance_field(self._goal_cell),
+               optimal_actions=optimal_actions)
+      os.replace(tmp_path, path)
+    except OSError:
+      pass  # the cache is an optimization only
+    return optimal_actions
+
+  def _make_raster(self):
+    # the layout of plot_walls: walls.T in normalized coordinates, no ticks
+    r = raster.Raster((0., 1.), (0., 1.))
+    r.axes_frame()
+    for (i, j) in zip(*np.where(self._walls)):
+      r.fill_rect(i / float(self._height), j / float(self._width),
+                  (i + 1) / float(self._height), (j + 1) / float(self._width), raster.GREY)
+    r.reset()
+    return r
 
-  def plot_trajectory(self):
+  def render(self, mode=None):
+    # current and end, drawn over the markers of the earlier steps of the episode
+    goal, state = self.goal, self._normalize_obs(self.state)
+    self._raster.dot(goal[0], goal[1], raster.GREEN)
+    self._raster.dot(state[0], state[1], raster.BLACK)
+    return self._raster.frame()
+
+  def plot_trajectory(self, obs_vec=None):
+    """Plot a trajectory, by default the current one, and save it to the logdir."""
+    if obs_vec is None:
+      obs_vec = self.obs_vec
+    self.plt.figure(self.fig.number)
     self.plt.clf()
     self.plot_walls()
 
-    obs_vec, goal = np.array(self.obs_vec), self.goal
+    goal = self.goal
     self.plt.plot(obs_vec[:, 0], obs_vec[:, 1], 'b-o', alpha=0.3)
     self.plt.scatter([obs_vec[0, 0]], [obs_vec[0, 1]], marker='+',
                 color='red', s=200, label='start')
@@ -530,11 +632,62 @@ class Pointmass(gym.Env):
     state_index = np.random.choice(num_candidate_states)
     state = np.array([candidate_states[0][state_index],
                       candidate_states[1][state_index]],
-                     dtype=np.float)
+                     dtype=float)
     state += np.random.uniform(size=2)
     assert not self._is_blocked(state)
     return state
 
+class BatchedPointmass(Pointmass):
+  """num_envs independent copies of Pointmass stepped together.
+
+  reset and step work on arrays with a leading num_envs axis. A copy that
+  reaches the goal or runs out of time is reset in place; step returns the
+  observations after those resets, and info['final_observation'] holds the
+  next observations before them."""
+
+  def __init__(self, num_envs, difficulty=0, dense_reward=False):
+    self.num_envs = num_envs
+    super(BatchedPointmass, self).__init__(
+        difficulty=difficulty, dense_reward=dense_reward, headless=True)
+    self._actions = np.array([ACT_DICT[i] for i in range(self.num_actions)])
+
+  def reset(self, seed=None):
+    if seed: self.seed(seed)
+
+    self.timesteps_left = np.full(self.num_envs, self.max_episode_steps)
+    self.states = np.tile(self.fixed_start, (self.num_envs, 1))
+    self.num_runs += self.num_envs
+    return self._normalize_obs_batch(self.states)
+
+  def _normalize_obs_batch(self, states):
+    return states / np.array([float(self._height), float(self._width)])
+
+  def step(self, actions):
+    self.timesteps_left -= 1
+
+    actions = self._actions[np.asarray(actions, dtype=int).reshape(self.num_envs)]
+    actions = np.random.normal(actions, self.action_noise)
+    self.states = self._simulate_steps(self.states, actions)
+
+    dist = np.linalg.norm(self.states - self.fixed_goal, axis=1)
+    reached = dist < self.epsilon
+    dones = reached | (self.timesteps_left == 0)
+    final_obs = self._normalize_obs_batch(self.states)
+
+    if self.dense_reward:
+      rewards = -dist
+    else:
+      rewards = reached.astype(int) - 1
+
+    obs = final_obs.copy()
+    if dones.any():
+      self.timesteps_left[dones] = self.max_episode_steps
+      self.states[dones] = self.fixed_start
+      self.num_runs += int(dones.sum())
+      obs[dones] = self._normalize_obs(self.fixed_start)
+
+    return obs, rewards, dones, {'final_observation': final_obs}
+
 def refresh_path():
   path = dict()
   path['observations'] = []
@@ -0,0 +1,90 @@
+import numpy as np
+
+# matplotlib colors used by the 2D envs
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+GREY = (128, 128, 128)
+RED = (255, 0, 0)
+GREEN = (0, 128, 0)
+
+
+class Raster(object):
+    """
+        Draws 2D envs straight into a uint8 RGB image, without matplotlib.
+        Data coordinates in xlim x ylim map onto the axes box of a default
+        640x480 matplotlib figure, with y pointing up.
+        Static content (walls, obstacles) is drawn once into the background;
+        reset copies it into the canvas, and markers drawn afterwards stay on
+        the canvas until the next reset, like points plotted on an axes that
+        is only cleared between episodes.
+    """
+
+    def __init__(self, xlim, ylim, height=480, width=640, box=(0.125, 0.11, 0.9, 0.88)):
+        left, bottom, right, top = box
+        self.xlim, self.ylim = xlim, ylim
+        self._cols = (left * width, right * width)
+        self._rows = ((1 - bottom) * height, (1 - top) * height)
+        self.background = np.full((height, width, 3), 255, dtype=np.uint8)
+        self.canvas = self.background.copy()
+        self._discs = {}
+
+    def to_pixels(self, x, y):
+        col = self._cols[0] + (x - self.xlim[0]) / (self.xlim[1] - self.xlim[0]) * (self._cols[1] - self._cols[0])
+        row = self._rows[0] + (y - self.ylim[0]) / (self.ylim[1] - self.ylim[0]) * (self._rows[1] - self._rows[0])
+        return col, row
+
+    def _fill_pixels(self, image, c0, r0, c1, r1, color):
+        height, width = image.shape[:2]
+        c0, c1 = int(round(min(c0, c1))), int(round(max(c0, c1)))
+        r0, r1 = int(round(min(r0, r1))), int(round(max(r0, r1)))
+        # at least one pixel wide, so thin lines do not vanish
+        c1, r1 = max(c1, c0 + 1), max(r1, r0 + 1)
+        image[max(r0, 0):min(r1, height), max(c0, 0):min(c1, width)] = color
+
+    def fill_rect(self, x0, y0, x1, y1, color, image=None):
+        """Fill the rectangle with corners (x0, y0), (x1, y1), by default into the background."""
+        image = self.background if image is None else image
+        c0, r0 = self.to_pixels(x0, y0)
+        c1, r1 = self.to_pixels(x1, y1)
+        self._fill_pixels(image, c0, r0, c1, r1, color)
+
+    def line(self, x0, y0, x1, y1, color, width=2, image=None):
+        """Draw a horizontal or vertical line, by default into the background."""
+        image = self.background if image is None else image
+        c0, r0 = self.to_pixels(x0, y0)
+        c1, r1 = self.to_pixels(x1, y1)
+        half = width / 2.
+        self._fill_pixels(image, min(c0, c1) - half, min(r0, r1) - half,
+                          max(c0, c1) + half, max(r0, r1) + half, color)
+
+    def rect_outline(self, x0, y0, x1, y1, color, width=2, image=None):
+        self.line(x0, y0, x1, y0, color, width, image)
+        self.line(x0, y1, x1, y1, color, width, image)
+        self.line(x0, y0, x0, y1, color, width, image)
+        self.line(x1, y0, x1, y1, color, width, image)
+
+    def axes_frame(self):
+        """Black spines around the axes box."""
+        self.rect_outline(self.xlim[0], self.ylim[0], self.xlim[1], self.ylim[1], BLACK, width=1)
+
+    def reset(self):
+        np.copyto(self.canvas, self.background)
+
+    def dot(self, x, y, color, radius=5):
+        """Draw a filled circle marker (matplotlib's 'o') onto the canvas."""
+        if radius not in self._discs:
+            offsets = np.arange(-radius, radius + 1)
+            d_row, d_col = np.meshgrid(offsets, offsets, indexing='ij')
+            disc = d_row ** 2 + d_col ** 2 <= radius ** 2
+            self._discs[radius] = (d_row[disc], d_col[disc])
+        d_row, d_col = self._discs[radius]
+        col, row = self.to_pixels(x, y)
+        rows = int(round(row)) + d_row
+        cols = int(round(col)) + d_col
+        height, width = self.canvas.shape[:2]
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        self.canvas[rows[inside], cols[inside]] = color
+
+    def frame(self):
+        """A copy of the canvas, so the frames of a video do not alias each other."""
+        return self.canvas.copy()
@@ -1,6 +1,7 @@
 from rob831.hw4_part2.infrastructure import pytorch_util as ptu
 from .base_exploration_model import BaseExplorationModel
 import torch.optim as optim
+import numpy as np
 from torch import nn
 import torch
 
@@ -14,22 +15,54 @@ def init_method_2(model):
 
 
 class RNDModel(nn.Module, BaseExplorationModel):
-    def __init__(self, hparams, optimizer_spec, **kwargs):
+    def __init__(self, hparams, optimizer_spec, normalize=True, rnd_gamma=0.99, normalize_obs=False, **kwargs):
         super().__init__(**kwargs)
         self.ob_dim = hparams['ob_dim']
         self.output_size = hparams['rnd_output_size']
         self.n_layers = hparams['rnd_n_layers']
         self.size = hparams['rnd_size']
         self.optimizer_spec = optimizer_spec
+        self.normalize = normalize
+        self.rnd_gamma = rnd_gamma
+        self.normalize_obs = normalize_obs
 
-        # <TODO>: Create two neural networks:
-        # 1) f, the random function we are trying to learn
-        # 2) f_hat, the function we are using to learn f
+        # f (member 0), the random function we are trying to learn, and
+        # f_hat (member 1), the function we are using to learn f, share one
+        # stacked network so both are evaluated in a single forward.
+        # f is frozen, so the optimizer only holds the weights of f_hat.
+        self.f_and_f_hat = ptu.build_ensemble_mlp(
+            2,
+            self.ob_dim,
+            self.output_size,
+            n_layers=self.n_layers,
+            size=self.size,
+            init_methods=[init_method_1, init_method_2],
+            n_frozen=1,
+        )
+        self.optimizer = self.optimizer_spec.constructor(
+            self.f_and_f_hat.parameters(),
+            **self.optimizer_spec.optim_kwargs
+        )
+        self.learning_rate_scheduler = optim.lr_scheduler.LambdaLR(
+            self.optimizer,
+            self.optimizer_spec.learning_rate_schedule,
+        )
+
+        # exponential moving average of the bonus std, kept on the device
+        self.register_buffer('running_bonus_std', torch.ones(()))
+        if self.normalize_obs:
+            # opt-in: whiten and clip the observations, as in the RND paper;
+            # this changes the bonus, so it is off by default
+            self.ob_rms = ptu.RunningMeanStd(self.ob_dim)
+        self.to(ptu.device)
 
     def forward(self, ob_no):
-        # <TODO>: Get the prediction error for ob_no
-        # HINT: Remember to detach the output of self.f!
-        pass
+        if self.normalize_obs:
+            ob_no = ((ob_no - self.ob_rms.mean) / self.ob_rms.std).clamp(-5, 5)
+        f_and_f_hat = self.f_and_f_hat(ob_no)
+        target, prediction = f_and_f_hat[0].detach(), f_and_f_hat[1]
+        # prediction error of every observation
+        return torch.norm(prediction - target, dim=1)
 
     def forward_np(self, ob_no):
         ob_no = ptu.from_numpy(ob_no)
@@ -37,6 +70,35 @@ class RNDModel(nn.Module, BaseExplorationModel):
         return ptu.to_numpy(error)
 
     def update(self, ob_no):
-        # <TODO>: Update f_hat using ob_no
-        # Hint: Take the mean prediction error across the batch
-        pass
+        _, loss = self.bonus_and_update(ob_no)
+        return loss
+
+    def bonus_and_update(self, ob_no):
+        """
+            One stacked forward on ob_no gives both the exploration bonus and the
+            loss of f_hat, which is then updated.
+            returns:
+                bonus: prediction error before the update, divided by an exponential
+                    moving average (rnd_gamma) of its batch std if normalize
+                loss: mean prediction error
+            both are tensors that stay on the device
+        """
+        if isinstance(ob_no, np.ndarray):
+            ob_no = ptu.from_numpy(ob_no)
+        if self.normalize_obs:
+            self.ob_rms.update(ob_no)
+
+        error = self(ob_no)
+        loss = error.mean()
+
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.optimizer.step()
+        self.learning_rate_scheduler.step()
+
+        bonus = error.detach()
+        if self.normalize:
+            # RND values vary highly in magnitude
+            self.running_bonus_std.mul_(self.rnd_gamma).add_((1 - self.rnd_gamma) * bonus.std(unbiased=False))
+            bonus = bonus / self.running_bonus_std
+        return bonus, loss.detach()
@@ -1,7 +1,10 @@
 """This file includes a collection of utility functions that are useful for
 implementing DQN."""
+import os
+import json
 import random
-from collections import namedtuple
+import zlib
+from collections import namedtuple, OrderedDict
 import pdb
 
 import gym
@@ -71,9 +74,10 @@ def get_env_kwargs(env_name):
             'q_func': create_atari_q_network,
             'learning_freq': 4,
             'grad_norm_clipping': 10,
-            'input_shape': (84, 84, 4),
+            'input_shape': (4, 84, 84),
             'env_wrappers': wrap_deepmind,
             'frame_history_len': 4,
+            'channels_first': True,
             'gamma': 0.99,
         }
         kwargs['optimizer_spec'] = atari_optimizer(kwargs['num_timesteps'])
@@ -91,6 +95,7 @@ def get_env_kwargs(env_name):
             'learning_starts': 1000,
             'learning_freq': 1,
             'frame_history_len': 1,
+            'channels_first': False,
             'target_update_freq': 3000,
             'grad_norm_clipping': 10,
             'lander': True,
@@ -110,6 +115,7 @@ def get_env_kwargs(env_name):
             'gamma': 0.95,
             'learning_freq': 1,
             'frame_history_len': 1,
+            'channels_first': False,
             'target_update_freq': 300,
             'grad_norm_clipping': 10,
             'lander': False,
@@ -142,17 +148,26 @@ class Ipdb(nn.Module):
 
 class PreprocessAtari(nn.Module):
     def forward(self, x):
-        # MJ: I needed to add `contiguous` here;
-            # might want to just add this in for students?
-        x = x.permute(0, 3, 1, 2).contiguous()
-        return x / 255.
+        # frames arrive channel-first and still uint8, so the cast happens on
+        # the device; the division by 255 is folded into the first conv
+        return x.float()
+
+
+class ScaledConv2d(nn.Conv2d):
+    """Conv2d of `input_scale * x`, computed by scaling the weight instead of the input."""
+    def __init__(self, *args, input_scale=1.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.input_scale = input_scale
+
+    def forward(self, x):
+        return self._conv_forward(x, self.weight * self.input_scale, self.bias)
 
 
 def create_atari_q_network(ob_dim, num_actions):
-    # TODO: diivde input by 255
+    # expects (batch, 4, 84, 84) uint8 frames, see MemoryOptimizedReplayBuffer(channels_first=True)
     return nn.Sequential(
         PreprocessAtari(),
-        nn.Conv2d(in_channels=4, out_channels=32, kernel_size=8, stride=4),
+        ScaledConv2d(in_channels=4, out_channels=32, kernel_size=8, stride=4, input_scale=1. / 255.),
         nn.ReLU(),
         nn.Conv2d(in_channels=32, out_channels=64, kernel_size=4, stride=2),
         nn.ReLU(),
@@ -390,8 +405,104 @@ def get_wrapper_by_name(env, classname):
         else:
             raise ValueError("Couldn't find wrapper named %s"%classname)
 
+class CompressedFrameStore(object):
+    def __init__(self, size, frame_shape, dtype, block_size=4, cache_blocks=512, level=1):
+        """Array-like frame storage that keeps frames zlib-compressed in
+        small blocks of consecutive indices.
+
+        Frames are written sequentially by the replay buffer, so only the block
+        under the write head is kept raw; it is compressed once the write head
+        moves on. Minibatch indices are spread uniformly over the buffer, so
+        blocks are kept small: a read only decompresses the few frames around
+        every requested index, and the `frame_history_len` frames of one
+        observation span at most two blocks. Reads decompress every touched
+        block once and keep the last `cache_blocks` decompressed blocks, which
+        covers the overlap between the observations and next observations of
+        a batch.
+
+        Parameters
+        ----------
+        size: int
+            Number of frames that can be stored.
+        frame_shape: tuple
+            Shape of a single frame.
+        dtype: np.dtype
+            Dtype of the stored frames.
+        block_size: int
+            Number of consecutive frames compressed together.
+        cache_blocks: int
+            Number of decompressed blocks kept around for reads.
+        level: int
+            zlib compression level.
+        """
+        self.size = size
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.shape = (size,) + self.frame_shape
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.level = level
+
+        self._blocks = [None] * ((size + block_size - 1) // block_size)
+        self._cache = OrderedDict()
+        self._open_id = None
+        self._open = None
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        """Bytes currently used by the compressed blocks and the open block."""
+        compressed = sum(len(c) for c in self._blocks if c is not None)
+        return compressed + (self._open.nbytes if self._open is not None else 0)
+
+    def _block(self, block_id):
+        if block_id == self._open_id:
+            return self._open
+        if block_id in self._cache:
+            self._cache.move_to_end(block_id)
+            return self._cache[block_id]
+        # every block holds block_size frames, the tail of the last one is never read
+        shape = (self.block_size,) + self.frame_shape
+        if self._blocks[block_id] is None:
+            return np.zeros(shape, dtype=self.dtype)
+        data = np.frombuffer(zlib.decompress(self._blocks[block_id]), dtype=self.dtype).reshape(shape)
+        self._cache[block_id] = data
+        if len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+        return data
+
+    def _close_open_block(self):
+        if self._open_id is not None:
+            self._blocks[self._open_id] = zlib.compress(self._open.tobytes(), self.level)
+        self._open_id = None
+        self._open = None
+
+    def __setitem__(self, idx, frame):
+        block_id = idx // self.block_size
+        if block_id != self._open_id:
+            self._close_open_block()
+            # the rest of the block still holds the oldest frames in the buffer
+            self._open = self._block(block_id).copy()
+            self._cache.pop(block_id, None)
+            self._open_id = block_id
+        self._open[idx - block_id * self.block_size] = frame
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            key = np.arange(*key.indices(self.size))
+        idxes = np.asarray(key)
+        flat = idxes.reshape(-1)
+        block_ids, inverse = np.unique(flat // self.block_size, return_inverse=True)
+        blocks = np.stack([self._block(block_id) for block_id in block_ids])
+        out = blocks[inverse.reshape(-1), flat % self.block_size]
+        return out.reshape(idxes.shape + self.frame_shape)
+
+
 class MemoryOptimizedReplayBuffer(object):
-    def __init__(self, size, frame_history_len, lander=False, float_obs=False):
+    def __init__(self, size, frame_history_len, lander=False, float_obs=False, storage_dir=None,
+                 compressed=False, channels_first=False):
         """This is a memory efficient implementation of the replay buffer.
 
         The sepecific memory optimizations use here are:
@@ -416,11 +527,30 @@ class MemoryOptimizedReplayBuffer(object):
             overflows the old memories are dropped.
         frame_history_len: int
             Number of memories to be retried for each observation.
+        storage_dir: str or None
+            If given, `obs`, `action`, `reward` and `done` live in `np.memmap`
+            backed .npy files in this directory instead of in RAM, one
+            contiguous row per frame, so the OS page cache decides what stays
+            resident. A buffer already stored in the directory is reopened,
+            which lets a restarted run keep its replay data.
+        compressed: bool
+            If True, frames are kept zlib-compressed in small blocks, see
+            `CompressedFrameStore`. Trades some CPU per sampled batch for a
+            several times smaller buffer. Cannot be combined with `storage_dir`.
+        channels_first: bool
+            If True, encoded image observations have shape
+            (img_c * frame_history_len, img_h, img_w) instead of
+            (img_h, img_w, img_c * frame_history_len), which is the layout
+            `create_atari_q_network` consumes without a permute.
         """
+        assert not (compressed and storage_dir is not None), "compressed storage is in-memory only"
         self.float_obs = lander or float_obs
+        self.compressed = compressed
+        self.channels_first = channels_first
 
         self.size = size
         self.frame_history_len = frame_history_len
+        self.storage_dir = storage_dir
 
         self.next_idx      = 0
         self.num_in_buffer = 0
@@ -429,17 +559,113 @@ class MemoryOptimizedReplayBuffer(object):
         self.action   = None
         self.reward   = None
         self.done     = None
+        self.counters = None
+
+        if storage_dir is not None:
+            os.makedirs(storage_dir, exist_ok=True)
+            if os.path.exists(self._storage_path('counters')):
+                self._open_storage()
+
+    def _storage_path(self, name):
+        return os.path.join(self.storage_dir, name + '.npy')
+
+    def _allocate(self, name, shape, dtype):
+        if self.storage_dir is None:
+            return np.empty(shape, dtype=dtype)
+        return np.lib.format.open_memmap(self._storage_path(name), mode='w+', dtype=dtype, shape=tuple(shape))
+
+    def _open_storage(self):
+        self.obs      = np.load(self._storage_path('obs'),      mmap_mode='r+')
+        self.action   = np.load(self._storage_path('action'),   mmap_mode='r+')
+        self.reward   = np.load(self._storage_path('reward'),   mmap_mode='r+')
+        self.done     = np.load(self._storage_path('done'),     mmap_mode='r+')
+        self.counters = np.load(self._storage_path('counters'), mmap_mode='r+')
+        assert self.obs.shape[0] == self.size, "stored buffer has size %d" % self.obs.shape[0]
+        self.next_idx, self.num_in_buffer = int(self.counters[0]), int(self.counters[1])
+
+    def flush(self):
+        """Write memory-mapped storage back to disk. No-op for in-memory buffers."""
+        if self.counters is not None:
+            for arr in (self.obs, self.action, self.reward, self.done, self.counters):
+                arr.flush()
+
+    def export_dataset(self, path):
+        """Write the buffer contents to `path` as an offline dataset.
+
+        Every field becomes one .npy column (`obs`, `action`, `reward`,
+        `done`) holding the `num_in_buffer` stored transitions oldest first,
+        next to a `dataset.json` with the buffer settings. The columns are
+        plain .npy files, so `load_dataset` can memory-map them.
+        """
+        os.makedirs(path, exist_ok=True)
+        order = (self.next_idx - self.num_in_buffer + np.arange(self.num_in_buffer)) % self.size
+        for name in ('obs', 'action', 'reward', 'done'):
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name)[order])
+        with open(os.path.join(path, 'dataset.json'), 'w') as f:
+            json.dump({
+                'num_transitions': int(self.num_in_buffer),
+                'frame_history_len': self.frame_history_len,
+                'float_obs': self.float_obs,
+            }, f)
+
+    def load_dataset(self, path):
+        """Fill an empty buffer with a dataset written by `export_dataset`.
+
+        The columns are memory-mapped copy-on-write instead of read, so even
+        a large dataset is available immediately and shared through the page
+        cache by every run using it. The buffer then holds exactly the
+        dataset: its size becomes the number of transitions, and frames
+        stored afterwards overwrite the oldest ones in memory only, never in
+        the dataset files.
+        """
+        assert self.num_in_buffer == 0, "datasets can only be loaded into an empty buffer"
+        with open(os.path.join(path, 'dataset.json')) as f:
+            meta = json.load(f)
+        assert meta['frame_history_len'] == self.frame_history_len, \
+            "dataset has frame_history_len %d" % meta['frame_history_len']
+
+        self.obs    = np.load(os.path.join(path, 'obs.npy'),    mmap_mode='c')
+        self.action = np.load(os.path.join(path, 'action.npy'), mmap_mode='c')
+        self.reward = np.load(os.path.join(path, 'reward.npy'), mmap_mode='c')
+        self.done   = np.load(os.path.join(path, 'done.npy'),   mmap_mode='c')
+        self.float_obs     = meta['float_obs']
+        self.size          = meta['num_transitions']
+        self.num_in_buffer = meta['num_transitions']
+        self.next_idx      = 0
+        # the dataset files are never written back
+        self.storage_dir   = None
+        self.counters      = None
 
-    def can_sample(self, batch_size):
+    def can_sample(self, batch_size, n_step=1):
         """Returns true if `batch_size` different transitions can be sampled from the buffer."""
-        return batch_size + 1 <= self.num_in_buffer
+        return batch_size + n_step <= self.num_in_buffer
 
     def _encode_sample(self, idxes):
-        obs_batch      = np.concatenate([self._encode_observation(idx)[None] for idx in idxes], 0)
+        idxes          = np.asarray(idxes)
+        obs_batch      = self._encode_observations(idxes)
         act_batch      = self.action[idxes]
         rew_batch      = self.reward[idxes]
-        next_obs_batch = np.concatenate([self._encode_observation(idx + 1)[None] for idx in idxes], 0)
-        done_mask      = np.array([1.0 if self.done[idx] else 0.0 for idx in idxes], dtype=np.float32)
+        next_obs_batch = self._encode_observations((idxes + 1) % self.size)
+        done_mask      = self.done[idxes].astype(np.float32)
+
+        return obs_batch, act_batch, rew_batch, next_obs_batch, done_mask
+
+    def _encode_n_step_sample(self, idxes, n_step, gamma):
+        # steps[i, k] is the buffer index of the k-th transition after idxes[i]
+        steps     = (idxes[:, None] + np.arange(n_step)[None]) % self.size
+        done_n    = self.done[steps].astype(np.float32)
+        # alive[i, k] is 1 while no episode boundary was hit up to and including step k,
+        # so taken[i, k] marks the steps whose reward belongs to the return
+        alive     = np.cumprod(1.0 - done_n, axis=1)
+        taken     = np.concatenate([np.ones_like(alive[:, :1]), alive[:, :-1]], axis=1)
+        discounts = gamma ** np.arange(n_step, dtype=np.float32)
+
+        obs_batch      = self._encode_observations(idxes)
+        act_batch      = self.action[idxes]
+        rew_batch      = np.sum(taken * discounts[None] * self.reward[steps], axis=1).astype(np.float32)
+        num_taken      = taken.sum(axis=1).astype(np.int64)
+        next_obs_batch = self._encode_observations((idxes + num_taken) % self.size)
+        done_mask      = (1.0 - alive[:, -1]).astype(np.float32)
 
         return obs_batch, act_batch, rew_batch, next_obs_batch, done_mask
 
@@ -479,7 +705,38 @@ class MemoryOptimizedReplayBuffer(object):
         """
         assert self.can_sample(batch_size)
         idxes = sample_n_unique(lambda: random.randint(0, self.num_in_buffer - 2), batch_size)
-        return self._encode_sample(idxes)
+        # sorted reads keep memory-mapped storage sequential; batch order does not matter
+        return self._encode_sample(np.sort(idxes))
+
+    def sample_n_step(self, batch_size, n_step, gamma):
+        """Sample `batch_size` different n-step transitions.
+
+        Same as `sample`, except that `rew_batch[i]` is the discounted sum
+        of the next `n_step` rewards and `next_obs_batch[i]` is the observation
+        `n_step` steps after `obs_batch[i]`. If the episode ended within those
+        steps, the sum stops at the terminal step and `done_mask[i]` is 1, so
+        the effective discount of the bootstrapped value is
+        `gamma ** n_step * (1 - done_mask)`. Windows never cross the most
+        recently stored frame.
+
+        Parameters
+        ----------
+        batch_size: int
+            How many transitions to sample.
+        n_step: int
+            Number of environment steps summed into each return.
+        gamma: float
+            Discount applied to the rewards inside the window.
+
+        Returns
+        -------
+        See `sample`.
+        """
+        assert self.can_sample(batch_size, n_step)
+        oldest = (self.next_idx - self.num_in_buffer) % self.size
+        offsets = sample_n_unique(lambda: random.randint(0, self.num_in_buffer - 1 - n_step), batch_size)
+        idxes = np.sort((oldest + np.asarray(offsets)) % self.size)
+        return self._encode_n_step_sample(idxes, n_step, gamma)
 
     def encode_recent_observation(self):
         """Return the most recent `frame_history_len` frames.
@@ -490,35 +747,32 @@ class MemoryOptimizedReplayBuffer(object):
             Array of shape (img_h, img_w, img_c * frame_history_len)
             and dtype np.uint8, where observation[:, :, i*img_c:(i+1)*img_c]
             encodes frame at time `t - frame_history_len + i`
+            (or (img_c * frame_history_len, img_h, img_w) if `channels_first`)
         """
         assert self.num_in_buffer > 0
-        return self._encode_observation((self.next_idx - 1) % self.size)
+        return self._encode_observations(np.array([(self.next_idx - 1) % self.size]))[0]
 
-    def _encode_observation(self, idx):
-        end_idx   = idx + 1 # make noninclusive
-        start_idx = end_idx - self.frame_history_len
-        # this checks if we are using low-dimensional observations, such as RAM
-        # state, in which case we just directly return the latest RAM.
+    def _encode_observations(self, idxes):
+        """Encode the observations ending at each of `idxes`, see `encode_recent_observation`."""
         if len(self.obs.shape) == 2:
-            return self.obs[end_idx-1]
+            return self.obs[idxes]
+        # idx_mat[i, -1] is the frame at idxes[i], earlier columns are its history
+        idx_mat = idxes[:, None] - np.arange(self.frame_history_len - 1, -1, -1)[None]
+        valid = np.ones(idx_mat.shape, dtype=bool)
         # if there weren't enough frames ever in the buffer for context
-        if start_idx < 0 and self.num_in_buffer != self.size:
-            start_idx = 0
-        for idx in range(start_idx, end_idx - 1):
-            if self.done[idx % self.size]:
-                start_idx = idx + 1
-        missing_context = self.frame_history_len - (end_idx - start_idx)
-        # if zero padding is needed for missing context
-        # or we are on the boundry of the buffer
-        if start_idx < 0 or missing_context > 0:
-            frames = [np.zeros_like(self.obs[0]) for _ in range(missing_context)]
-            for idx in range(start_idx, end_idx):
-                frames.append(self.obs[idx % self.size])
-            return np.concatenate(frames, 2)
-        else:
-            # this optimization has potential to saves about 30% compute time \o/
-            img_h, img_w = self.obs.shape[1], self.obs.shape[2]
-            return self.obs[start_idx:end_idx].transpose(1, 2, 0, 3).reshape(img_h, img_w, -1)
+        if self.num_in_buffer != self.size:
+            valid &= idx_mat >= 0
+        idx_mat %= self.size
+        # a done flag on a history frame cuts off that frame and all earlier ones
+        done_mat = self.done[idx_mat[:, :-1]]
+        valid[:, :-1] &= ~np.logical_or.accumulate(done_mat[:, ::-1], axis=1)[:, ::-1]
+
+        frames = self.obs[idx_mat]
+        frames[~valid] = 0
+        img_h, img_w = self.obs.shape[1], self.obs.shape[2]
+        if self.channels_first:
+            return frames.transpose(0, 1, 4, 2, 3).reshape(len(idxes), -1, img_h, img_w)
+        return frames.transpose(0, 2, 3, 1, 4).reshape(len(idxes), img_h, img_w, -1)
 
     def store_frame(self, frame):
         """Store a single frame in the buffer at the next available index, overwriting
@@ -536,15 +790,24 @@ class MemoryOptimizedReplayBuffer(object):
             Index at which the frame is stored. To be used for `store_effect` later.
         """
         if self.obs is None:
-            self.obs      = np.empty([self.size] + list(frame.shape), dtype=np.float32 if self.float_obs else np.uint8)
-            self.action   = np.empty([self.size],                     dtype=np.int32)
-            self.reward   = np.empty([self.size],                     dtype=np.float32)
-            self.done     = np.empty([self.size],                     dtype=np.bool)
+            obs_dtype = np.float32 if self.float_obs else np.uint8
+            if self.compressed:
+                self.obs  = CompressedFrameStore(self.size, frame.shape, obs_dtype)
+            else:
+                self.obs  = self._allocate('obs',    [self.size] + list(frame.shape), dtype=obs_dtype)
+            self.action   = self._allocate('action', [self.size],                     dtype=np.int32)
+            self.reward   = self._allocate('reward', [self.size],                     dtype=np.float32)
+            self.done     = self._allocate('done',   [self.size],                     dtype=bool)
+            if self.storage_dir is not None:
+                self.counters = self._allocate('counters', [2], dtype=np.int64)
         self.obs[self.next_idx] = frame
 
         ret = self.next_idx
         self.next_idx = (self.next_idx + 1) % self.size
         self.num_in_buffer = min(self.size, self.num_in_buffer + 1)
+        if self.counters is not None:
+            self.counters[0] = self.next_idx
+            self.counters[1] = self.num_in_buffer
 
         return ret
 
@@ -1,5 +1,7 @@
+from types import SimpleNamespace
 from typing import Union
 
+import numpy as np
 import torch
 from torch import nn
 
@@ -64,6 +66,109 @@ def build_mlp(
     return nn.Sequential(*layers)
 
 
+class EnsembleLinear(nn.Module):
+    """
+        n_members independent linear layers stored as one stacked weight
+        input: (batch_size, in_features), shared by all members, or
+            (n_members, batch_size, in_features)
+        output: (n_members, batch_size, out_features)
+        The first n_frozen members are fixed: their weights are buffers, so
+        optimizers built from parameters() only see the other members.
+    """
+    def __init__(self, n_members: int, in_features: int, out_features: int, init_methods=None, n_frozen=0):
+        super().__init__()
+        weight = torch.empty(n_members, in_features, out_features)
+        bias = torch.empty(n_members, 1, out_features)
+        # same initialization as nn.Linear, for every member
+        bound = 1. / in_features ** 0.5
+        nn.init.uniform_(weight, -bound, bound)
+        nn.init.uniform_(bias, -bound, bound)
+        # init_methods[i] (as for build_mlp) re-initializes member i in place
+        if init_methods is not None:
+            for i, init_method in enumerate(init_methods):
+                if init_method is not None:
+                    init_method(SimpleNamespace(weight=weight[i], bias=bias[i]))
+        self.n_frozen = n_frozen
+        self.register_buffer('frozen_weight', weight[:n_frozen].clone())
+        self.register_buffer('frozen_bias', bias[:n_frozen].clone())
+        self.weight = nn.Parameter(weight[n_frozen:].clone())
+        self.bias = nn.Parameter(bias[n_frozen:].clone())
+
+    def forward(self, x):
+        if self.n_frozen == 0:
+            return torch.matmul(x, self.weight) + self.bias
+        weight = torch.cat([self.frozen_weight, self.weight])
+        bias = torch.cat([self.frozen_bias, self.bias])
+        return torch.matmul(x, weight) + bias
+
+
+def build_ensemble_mlp(
+        n_members: int,
+        input_size: int,
+        output_size: int,
+        n_layers: int,
+        size: int,
+        activation: Activation = 'tanh',
+        output_activation: Activation = 'identity',
+        init_methods=None,
+        n_frozen=0,
+):
+    """
+        Builds n_members feedforward networks with the architecture of build_mlp
+        whose layers are evaluated for all members in one batched matmul
+        arguments:
+            init_methods: optional list with one init_method (see build_mlp) per member
+            n_frozen: number of leading members that are not trained (see EnsembleLinear)
+        returns:
+            a module mapping (batch_size, input_size) to (n_members, batch_size, output_size)
+    """
+    if isinstance(activation, str):
+        activation = _str_to_activation[activation]
+    if isinstance(output_activation, str):
+        output_activation = _str_to_activation[output_activation]
+    layers = []
+    in_size = input_size
+    for _ in range(n_layers):
+        layers.append(EnsembleLinear(n_members, in_size, size, init_methods, n_frozen))
+        layers.append(activation)
+        in_size = size
+    layers.append(EnsembleLinear(n_members, in_size, output_size, init_methods, n_frozen))
+    layers.append(output_activation)
+    return nn.Sequential(*layers)
+
+
+class RunningMeanStd(nn.Module):
+    """
+        Running mean/variance over the first axis of every batch passed to update,
+        kept on the device (as buffers) and merged with Chan et al.'s parallel
+        form of Welford's algorithm.
+    """
+    def __init__(self, shape=(), epsilon=1e-8):
+        super().__init__()
+        self.epsilon = epsilon
+        self.register_buffer('mean', torch.zeros(shape))
+        self.register_buffer('var', torch.ones(shape))
+        self.register_buffer('count', torch.zeros(()))
+
+    @torch.no_grad()
+    def update(self, x):
+        batch_count = x.shape[0]
+        batch_mean = x.mean(dim=0)
+        batch_var = x.var(dim=0, unbiased=False)
+
+        delta = batch_mean - self.mean
+        total_count = self.count + batch_count
+        m2 = (self.var * self.count + batch_var * batch_count
+              + delta ** 2 * self.count * batch_count / total_count)
+        self.mean += delta * batch_count / total_count
+        self.var.copy_(m2 / total_count)
+        self.count.copy_(total_count)
+
+    @property
+    def std(self):
+        return torch.sqrt(self.var + self.epsilon)
+
+
 device = None
 
 
@@ -84,6 +189,18 @@ def set_device(gpu_id):
 def from_numpy(*args, **kwargs):
     return torch.from_numpy(*args, **kwargs).float().to(device)
 
+def from_numpy_obs(array):
+    # uint8 frames are copied to the device as is and cast there by the network
+    if array.dtype == np.uint8:
+        return torch.from_numpy(array).to(device)
+    return from_numpy(array)
+
+def as_tensor(data):
+    # rewards may already be on the device, e.g. the RND bonus
+    if isinstance(data, torch.Tensor):
+        return data.float().to(device)
+    return from_numpy(data)
+
 def ones(*args, **kwargs):
     return torch.ones(*args, **kwargs).to(device)
 
@@ -4,6 +4,7 @@ import os
 import sys
 import time
 import pdb
+from concurrent.futures import ThreadPoolExecutor
 
 import gym
 from gym import wrappers
@@ -29,6 +30,58 @@ MAX_NVIDEO = 2
 MAX_VIDEO_LEN = 40 # we overwrite this in the code below
 
 
+def save_density_graphs(logdir, state_density, value_grids):
+    """
+        Saves the state density and the (title, grid) value_grids as
+        curr_<name>.png images. Uses matplotlib's object-oriented API (no pyplot
+        state), so it is safe to call off the training thread.
+    """
+    from matplotlib.figure import Figure
+    filepath = lambda name: logdir+'/curr_{}.png'.format(name)
+
+    fig = Figure()
+    ax = fig.add_subplot(1, 1, 1)
+    fig.colorbar(ax.imshow(np.rot90(state_density), interpolation='bicubic'), ax=ax)
+    ax.set_title('State Density')
+    fig.savefig(filepath('state_density'), bbox_inches='tight')
+
+    for name, (title, values) in value_grids.items():
+        fig = Figure()
+        ax = fig.add_subplot(1, 1, 1)
+        fig.colorbar(ax.imshow(values[::-1]), ax=ax)
+        ax.set_title(title)
+        fig.savefig(filepath(name), bbox_inches='tight')
+
+
+def density_value_grids(agent):
+    """
+        The RND value and the mean predicted Q-values of both critics of agent on a
+        grid over the unit square, as {name: (title, grid)} for save_density_graphs.
+        All grids come from one no-grad pass and one copy to the host, so the
+        training thread only waits for a single transfer.
+    """
+    ii, jj = np.meshgrid(np.linspace(0, 1), np.linspace(0, 1))
+    obs = ptu.from_numpy(np.stack([ii.flatten(), jj.flatten()], axis=1))
+    with torch.no_grad():
+        rnd_value = agent.exploration_model(obs)
+        if getattr(agent, 'shared_critic', False):
+            # one forward of the shared trunk gives the values of both heads
+            head_values = agent.critic.head_qa_values(obs).mean(-1)
+            exploitation_value = head_values[:, agent.exploitation_critic.index]
+            exploration_value = head_values[:, agent.exploration_critic.index]
+        else:
+            exploitation_value = agent.exploitation_critic.q_net(obs).mean(-1)
+            exploration_value = agent.exploration_critic.q_net(obs).mean(-1)
+        grids = ptu.to_numpy(torch.stack([rnd_value, exploitation_value, exploration_value]))
+    grids = grids.reshape((3,) + ii.shape)
+
+    value_grids = OrderedDict()
+    value_grids['rnd_value'] = ('RND Value', grids[0])
+    value_grids['exploitation_value'] = ('Predicted Exploitation Value', grids[1])
+    value_grids['exploration_value'] = ('Predicted Exploration Value', grids[2])
+    return value_grids
+
+
 class RL_Trainer(object):
 
     def __init__(self, params):
@@ -40,6 +93,8 @@ class RL_Trainer(object):
         # Get params, create logger
         self.params = params
         self.logger = Logger(self.params['logdir'])
+        self.plot_executor = None
+        self.plot_futures = []
 
         # Set random seeds
         seed = self.params['seed']
@@ -56,8 +111,12 @@ class RL_Trainer(object):
 
         # Make the gym environment
         register_custom_envs()
-        self.env = gym.make(self.params['env_name'])
-        self.eval_env = gym.make(self.params['env_name'])
+        env_kwargs = {}
+        if 'Pointmass' in self.params['env_name']:
+            # headless pointmass envs only plot trajectories in dump_density_graphs
+            env_kwargs['headless'] = self.params['headless_pointmass']
+        self.env = gym.make(self.params['env_name'], **env_kwargs)
+        self.eval_env = gym.make(self.params['env_name'], **env_kwargs)
         if not ('pointmass' in self.params['env_name']):
             import matplotlib
             matplotlib.use('Agg')
@@ -201,7 +260,8 @@ class RL_Trainer(object):
             all_logs = self.train_agent()
 
             # Log densities and output trajectories
-            if isinstance(self.agent, ExplorationOrExploitationAgent) and (itr % print_period == 0):
+            if isinstance(self.agent, ExplorationOrExploitationAgent) and (
+                    itr % self.params['density_dump_freq'] == 0 or itr == n_iter - 1):
                 self.dump_density_graphs(itr)
 
             # log/save
@@ -216,9 +276,33 @@ class RL_Trainer(object):
                 if self.params['save_params']:
                     self.agent.save('{}/agent_itr_{}.pt'.format(self.params['logdir'], itr))
 
+        self.finish_plots()
+
     ####################################
     ####################################
 
+    def submit_plot(self, fn, *args):
+        """
+            Runs fn(*args) on the background plotting thread. Errors of earlier
+            plots that have finished by now are raised here.
+        """
+        if self.plot_executor is None:
+            self.plot_executor = ThreadPoolExecutor(max_workers=1)
+        for future in [future for future in self.plot_futures if future.done()]:
+            self.plot_futures.remove(future)
+            future.result()
+        self.plot_futures.append(self.plot_executor.submit(fn, *args))
+
+    def finish_plots(self):
+        """Waits for the pending plots, raising their errors, and stops the plotting thread"""
+        if self.plot_executor is None:
+            return
+        self.plot_executor.shutdown(wait=True)
+        self.plot_executor = None
+        futures, self.plot_futures = self.plot_futures, []
+        for future in futures:
+            future.result()
+
     def collect_training_trajectories(self, itr, initial_expertdata, collect_policy, num_transitions_to_sample, save_expert_data_to_disk=False):
         """
         :param itr:
@@ -296,7 +380,9 @@ class RL_Trainer(object):
             print("running time %f" % time_since_start)
             logs["TimeSinceStart"] = time_since_start
 
-        logs.update(last_log)
+        # critics may keep their logging scalars on the device; sync them once, here
+        logs.update({key: value.item() if torch.is_tensor(value) else value
+                     for key, value in last_log.items()})
         
         eval_paths, eval_envsteps_this_batch = utils.sample_trajectories(self.eval_env, self.agent.eval_policy, self.params['eval_batch_size'], self.params['ep_len'])
         
@@ -310,6 +396,9 @@ class RL_Trainer(object):
         logs["Eval_AverageEpLen"] = np.mean(eval_ep_lens)
         
         logs['Buffer size'] = self.agent.replay_buffer.num_in_buffer
+        logs['State Coverage'] = self.agent.visitation.coverage()
+        logs['State Visitation Entropy'] = self.agent.visitation.entropy()
+        self.agent.replay_buffer.flush()
 
         sys.stdout.flush()
 
@@ -370,7 +459,9 @@ class RL_Trainer(object):
 
             logs["Train_EnvstepsSoFar"] = self.total_envsteps
             logs["TimeSinceStart"] = time.time() - self.start_time
-            logs.update(last_log)
+            # critics may keep their logging scalars on the device; sync them once, here
+            logs.update({key: value.item() if torch.is_tensor(value) else value
+                         for key, value in last_log.items()})
 
             if itr == 0:
                 self.initial_return = np.mean(train_returns)
@@ -388,42 +479,14 @@ class RL_Trainer(object):
             self.logger.flush()
 
     def dump_density_graphs(self, itr):
-        import matplotlib.pyplot as plt
-        self.fig = plt.figure()
-        filepath = lambda name: self.params['logdir']+'/curr_{}.png'.format(name)
+        if self.agent.visitation.total == 0: return
 
-        num_states = self.agent.replay_buffer.num_in_buffer - 2
-        states = self.agent.replay_buffer.obs[:num_states]
-        if num_states <= 0: return
-        
-        H, xedges, yedges = np.histogram2d(states[:,0], states[:,1], range=[[0., 1.], [0., 1.]], density=True)
-        plt.imshow(np.rot90(H), interpolation='bicubic')
-        plt.colorbar()
-        plt.title('State Density')
-        self.fig.savefig(filepath('state_density'), bbox_inches='tight')
-
-        plt.clf()
-        ii, jj = np.meshgrid(np.linspace(0, 1), np.linspace(0, 1))
-        obs = np.stack([ii.flatten(), jj.flatten()], axis=1)
-        density = self.agent.exploration_model.forward_np(obs)
-        density = density.reshape(ii.shape)
-        plt.imshow(density[::-1])
-        plt.colorbar()
-        plt.title('RND Value')
-        self.fig.savefig(filepath('rnd_value'), bbox_inches='tight')
-
-        plt.clf()
-        exploitation_values = self.agent.exploitation_critic.qa_values(obs).mean(-1)
-        exploitation_values = exploitation_values.reshape(ii.shape)
-        plt.imshow(exploitation_values[::-1])
-        plt.colorbar()
-        plt.title('Predicted Exploitation Value')
-        self.fig.savefig(filepath('exploitation_value'), bbox_inches='tight')
-
-        plt.clf()
-        exploration_values = self.agent.exploration_critic.qa_values(obs).mean(-1)
-        exploration_values = exploration_values.reshape(ii.shape)
-        plt.imshow(exploration_values[::-1])
-        plt.colorbar()
-        plt.title('Predicted Exploration Value')
-        self.fig.savefig(filepath('exploration_value'), bbox_inches='tight')
+        # evaluate the model and critics here, save the images off the training thread
+        self.submit_plot(
+            save_density_graphs, self.params['logdir'], self.agent.visitation.density(),
+            density_value_grids(self.agent))
+
+        if self.params['headless_pointmass']:
+            # the trajectories the envs would have saved on every reset
+            for env in (self.env, self.eval_env):
+                env.plot_trajectory(env.get_last_trajectory())
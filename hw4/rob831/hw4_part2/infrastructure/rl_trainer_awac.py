@@ -4,6 +4,7 @@ import os
 import sys
 import time
 import pdb
+from concurrent.futures import ThreadPoolExecutor
 
 import gym
 from gym import wrappers
@@ -14,6 +15,7 @@ from rob831.hw4_part2.infrastructure.atari_wrappers import ReturnWrapper
 
 from rob831.hw4_part2.infrastructure import utils
 from rob831.hw4_part2.infrastructure.logger import Logger
+from rob831.hw4_part2.infrastructure.rl_trainer import save_density_graphs, density_value_grids
 
 from rob831.hw4_part2.agents.awac_agent import AWACAgent
 from rob831.hw4_part2.agents.iql_agent import IQLAgent
@@ -41,6 +43,8 @@ class RL_Trainer(object):
         # Get params, create logger
         self.params = params
         self.logger = Logger(self.params['logdir'])
+        self.plot_executor = None
+        self.plot_futures = []
 
         # Set random seeds
         seed = self.params['seed']
@@ -216,9 +220,33 @@ class RL_Trainer(object):
                 if self.params['save_params']:
                     self.agent.save('{}/agent_itr_{}.pt'.format(self.params['logdir'], itr))
 
+        self.finish_plots()
+
     ####################################
     ####################################
 
+    def submit_plot(self, fn, *args):
+        """
+            Runs fn(*args) on the background plotting thread. Errors of earlier
+            plots that have finished by now are raised here.
+        """
+        if self.plot_executor is None:
+            self.plot_executor = ThreadPoolExecutor(max_workers=1)
+        for future in [future for future in self.plot_futures if future.done()]:
+            self.plot_futures.remove(future)
+            future.result()
+        self.plot_futures.append(self.plot_executor.submit(fn, *args))
+
+    def finish_plots(self):
+        """Waits for the pending plots, raising their errors, and stops the plotting thread"""
+        if self.plot_executor is None:
+            return
+        self.plot_executor.shutdown(wait=True)
+        self.plot_executor = None
+        futures, self.plot_futures = self.plot_futures, []
+        for future in futures:
+            future.result()
+
     def collect_training_trajectories(self, itr, initial_expertdata, collect_policy, num_transitions_to_sample, save_expert_data_to_disk=False):
         """
         :param itr:
@@ -296,7 +324,9 @@ class RL_Trainer(object):
             print("running time %f" % time_since_start)
             logs["TimeSinceStart"] = time_since_start
 
-        logs.update(last_log)
+        # critics and the actor keep their logging scalars on the device; sync them once, here
+        logs.update({key: value.item() if torch.is_tensor(value) else value
+                     for key, value in last_log.items()})
         
         eval_paths, eval_envsteps_this_batch = utils.sample_trajectories(self.eval_env, self.agent.eval_policy, self.params['eval_batch_size'], self.params['ep_len'])
         
@@ -310,6 +340,8 @@ class RL_Trainer(object):
         logs["Eval_AverageEpLen"] = np.mean(eval_ep_lens)
         
         logs['Buffer size'] = self.agent.replay_buffer.num_in_buffer
+        logs['State Coverage'] = self.agent.visitation.coverage()
+        logs['State Visitation Entropy'] = self.agent.visitation.entropy()
 
         sys.stdout.flush()
 
@@ -370,7 +402,9 @@ class RL_Trainer(object):
 
             logs["Train_EnvstepsSoFar"] = self.total_envsteps
             logs["TimeSinceStart"] = time.time() - self.start_time
-            logs.update(last_log)
+            # critics and the actor keep their logging scalars on the device; sync them once, here
+            logs.update({key: value.item() if torch.is_tensor(value) else value
+                         for key, value in last_log.items()})
 
             if itr == 0:
                 self.initial_return = np.mean(train_returns)
@@ -388,42 +422,9 @@ class RL_Trainer(object):
             self.logger.flush()
 
     def dump_density_graphs(self, itr):
-        import matplotlib.pyplot as plt
-        self.fig = plt.figure()
-        filepath = lambda name: self.params['logdir']+'/curr_{}.png'.format(name)
+        if self.agent.visitation.total == 0: return
 
-        num_states = self.agent.replay_buffer.num_in_buffer - 2
-        states = self.agent.replay_buffer.obs[:num_states]
-        if num_states <= 0: return
-        
-        H, xedges, yedges = np.histogram2d(states[:,0], states[:,1], range=[[0., 1.], [0., 1.]], density=True)
-        plt.imshow(np.rot90(H), interpolation='bicubic')
-        plt.colorbar()
-        plt.title('State Density')
-        self.fig.savefig(filepath('state_density'), bbox_inches='tight')
-
-        plt.clf()
-        ii, jj = np.meshgrid(np.linspace(0, 1), np.linspace(0, 1))
-        obs = np.stack([ii.flatten(), jj.flatten()], axis=1)
-        density = self.agent.exploration_model.forward_np(obs)
-        density = density.reshape(ii.shape)
-        plt.imshow(density[::-1])
-        plt.colorbar()
-        plt.title('RND Value')
-        self.fig.savefig(filepath('rnd_value'), bbox_inches='tight')
-
-        plt.clf()
-        exploitation_values = self.agent.exploitation_critic.qa_values(obs).mean(-1)
-        exploitation_values = exploitation_values.reshape(ii.shape)
-        plt.imshow(exploitation_values[::-1])
-        plt.colorbar()
-        plt.title('Predicted Exploitation Value')
-        self.fig.savefig(filepath('exploitation_value'), bbox_inches='tight')
-
-        plt.clf()
-        exploration_values = self.agent.exploration_critic.qa_values(obs).mean(-1)
-        exploration_values = exploration_values.reshape(ii.shape)
-        plt.imshow(exploration_values[::-1])
-        plt.colorbar()
-        plt.title('Predicted Exploration Value')
-        self.fig.savefig(filepath('exploration_value'), bbox_inches='tight')
+        # evaluate the model and critics here, save the images off the training thread
+        self.submit_plot(
+            save_density_graphs, self.params['logdir'], self.agent.visitation.density(),
+            density_value_grids(self.agent))
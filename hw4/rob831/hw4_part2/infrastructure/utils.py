@@ -175,3 +175,64 @@ def add_noise(data_inp, noiseToSignal=0.01):
             0, np.absolute(std_of_noise[j]), (data.shape[0],)))
 
     return data
+
+############################################
+############################################
+
+class VisitationCounts(object):
+    """
+        Visit counts of 2D observations on a bins x bins grid over [low, high]^2,
+        the grid of np.histogram2d(..., bins=bins, range=[[low, high], [low, high]]).
+        add is O(1) per observation, so the counts can follow every stored frame
+        and the coverage metrics are cheap enough to log at every logging step.
+    """
+    def __init__(self, bins=10, low=0., high=1.):
+        self.bins = bins
+        self.low = low
+        self.high = high
+        self.counts = np.zeros((bins, bins), dtype=np.int64)
+        self.total = 0
+        self.num_visited = 0
+        self._scale = bins / float(high - low)
+        self._edges = np.linspace(low, high, bins + 1)
+
+    def _index(self, x):
+        i = min(max(int((x - self.low) * self._scale), 0), self.bins - 1)
+        # the scaled value can round across an edge; compare with the edges
+        # themselves, as np.histogram2d does
+        if x < self._edges[i] and i > 0:
+            i -= 1
+        elif i < self.bins - 1 and x >= self._edges[i + 1]:
+            i += 1
+        return i
+
+    def add(self, ob):
+        i, j = self._index(ob[0]), self._index(ob[1])
+        if self.counts[i, j] == 0:
+            self.num_visited += 1
+        self.counts[i, j] += 1
+        self.total += 1
+
+    def add_batch(self, obs):
+        cells = np.stack([
+            np.clip(np.searchsorted(self._edges, obs[:, k], side='right') - 1, 0, self.bins - 1)
+            for k in range(2)], axis=1)
+        np.add.at(self.counts, (cells[:, 0], cells[:, 1]), 1)
+        self.total += len(obs)
+        self.num_visited = int(np.count_nonzero(self.counts))
+
+    def coverage(self):
+        """Fraction of the grid cells visited at least once."""
+        return self.num_visited / float(self.bins * self.bins)
+
+    def entropy(self):
+        """Entropy (in nats) of the empirical visitation distribution over the cells."""
+        if self.total == 0:
+            return 0.
+        p = self.counts[self.counts > 0] / float(self.total)
+        return float(-(p * np.log(p)).sum())
+
+    def density(self):
+        """The counts as a density over [low, high]^2, like np.histogram2d(..., density=True)."""
+        cell_area = ((self.high - self.low) / float(self.bins)) ** 2
+        return self.counts / (max(self.total, 1) * cell_area)
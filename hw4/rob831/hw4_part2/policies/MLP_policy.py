@@ -169,8 +169,15 @@ class MLPPolicyAWAC(MLPPolicy):
         if isinstance(adv_n, np.ndarray):
             adv_n = ptu.from_numpy(adv_n)
 
-        # TODO update the policy network utilizing AWAC update
-
-        actor_loss = None
-        
-        return actor_loss.item()
+        # advantage-weighted log-likelihood of the dataset actions
+        action_distribution = self(observations)
+        log_prob_n = action_distribution.log_prob(actions)
+        weights_n = torch.exp(adv_n / self.lambda_awac)
+        actor_loss = -(log_prob_n * weights_n).mean()
+
+        self.optimizer.zero_grad()
+        actor_loss.backward()
+        self.optimizer.step()
+
+        # the loss stays on the device; the trainer syncs it when it logs
+        return actor_loss.detach()
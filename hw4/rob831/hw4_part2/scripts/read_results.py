@@ -1,18 +1,13 @@
-import glob
-import tensorflow as tf
+from rob831.tb_reader import read_scalars
+
 
 def get_section_results(file):
     """
-        requires tensorflow==1.12.0
+        reads the Train_EnvstepsSoFar and Eval_AverageReturn values of an event file
     """
-    X = []
-    Y = []
-    for e in tf.train.summary_iterator(file):
-        for v in e.summary.value:
-            if v.tag == 'Train_EnvstepsSoFar':
-                X.append(v.simple_value)
-            elif v.tag == 'Eval_AverageReturn':
-                Y.append(v.simple_value)
+    scalars = read_scalars(file, tags=['Train_EnvstepsSoFar', 'Eval_AverageReturn'])
+    X = scalars['Train_EnvstepsSoFar'][1].tolist() if 'Train_EnvstepsSoFar' in scalars else []
+    Y = scalars['Eval_AverageReturn'][1].tolist() if 'Eval_AverageReturn' in scalars else []
     return X, Y
 
 if __name__ == '__main__':
@@ -58,6 +58,7 @@ def main():
 
     parser.add_argument('--offline_exploitation', action='store_true')
     parser.add_argument('--cql_alpha', type=float, default=0.0)
+    parser.add_argument('--shared_critic', action='store_true') # one trunk with separate exploration/exploitation Q-heads
 
     parser.add_argument('--exploit_rew_shift', type=float, default=0.0)
     parser.add_argument('--exploit_rew_scale', type=float, default=1.0)
@@ -73,6 +74,14 @@ def main():
     parser.add_argument('--save_params', action='store_true')
 
     parser.add_argument('--use_boltzmann', action='store_true')
+    parser.add_argument('--n_step', type=int, default=1) # n-step returns, not with --use_rnd or --unsupervised_exploration
+    parser.add_argument('--replay_storage_dir', type=str, default=None) # keep the replay buffer in memory-mapped files here
+    parser.add_argument('--compress_replay', action='store_true') # keep replay frames zlib-compressed in memory
+    parser.add_argument('--export_dataset_dir', type=str, default=None) # save the replay buffer here once exploration ends
+    parser.add_argument('--load_dataset_dir', type=str, default=None) # exploit a dataset saved with --export_dataset_dir, needs --offline_exploitation
+    parser.add_argument('--headless_pointmass', action='store_true') # only plot trajectories when the density graphs are dumped
+    parser.add_argument('--visitation_bins', type=int, default=10) # grid of the state coverage metrics and density graph
+    parser.add_argument('--density_dump_freq', type=int, default=5000) # iterations between density graph dumps
 
     args = parser.parse_args()
 
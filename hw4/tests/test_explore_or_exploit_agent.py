@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from rob831.hw4_part2.agents.explore_or_exploit_agent import ExplorationOrExploitationAgent
+from rob831.hw4_part2.envs.pointmass.pointmass import Pointmass
+from rob831.hw4_part2.infrastructure import pytorch_util as ptu
+from rob831.hw4_part2.infrastructure.dqn_utils import get_env_kwargs, ConstantSchedule
+
+
+def make_agent(**overrides):
+    ptu.init_gpu(use_gpu=False)
+    env = Pointmass(difficulty=0, headless=True)
+    params = {
+        'env_name': 'PointmassEasy-v0', 'ob_dim': 2, 'ac_dim': env.action_space.n,
+        'batch_size': 32, 'double_q': True, 'n_step': 1, 'eps': 0.2,
+        'use_rnd': False, 'unsupervised_exploration': False, 'num_exploration_steps': 300,
+        'offline_exploitation': False, 'cql_alpha': 0.0, 'shared_critic': False,
+        'exploit_rew_shift': 0.0, 'exploit_rew_scale': 1.0,
+        'rnd_output_size': 5, 'rnd_n_layers': 2, 'rnd_size': 64,
+        'replay_storage_dir': None, 'compress_replay': False,
+        'export_dataset_dir': None, 'load_dataset_dir': None, 'visitation_bins': 10,
+        'explore_weight_schedule': ConstantSchedule(0.0), 'exploit_weight_schedule': ConstantSchedule(1.0),
+        **get_env_kwargs('PointmassEasy-v0'),
+    }
+    params['learning_starts'] = params['num_exploration_steps']
+    params.update(overrides)
+    return ExplorationOrExploitationAgent(env, params)
+
+
+def run(agent, num_steps):
+    for _ in range(num_steps):
+        agent.step_env()
+        agent.train(*agent.replay_buffer.sample(agent.batch_size))
+
+
+def test_loaded_dataset_is_exploited_without_exploring(tmp_path):
+    explorer = make_agent(export_dataset_dir=str(tmp_path))
+    for _ in range(explorer.num_exploration_steps + 1):
+        explorer.step_env()
+        explorer.t += 1
+    saved = {name: np.load(tmp_path / (name + '.npy')) for name in ('obs', 'action', 'reward', 'done')}
+
+    agent = make_agent(load_dataset_dir=str(tmp_path), offline_exploitation=True)
+    buffer = agent.replay_buffer
+    assert agent.t > agent.num_exploration_steps
+    run(agent, 200)
+    assert agent.actor.critic is agent.exploitation_critic
+
+    for name, column in saved.items():
+        assert np.array_equal(getattr(buffer, name)[:buffer.num_in_buffer], column), name
+    assert buffer.num_in_buffer == len(saved['obs'])
+    assert agent.visitation.total == len(saved['obs'])
+
+
+def test_loading_a_dataset_requires_offline_exploitation(tmp_path):
+    explorer = make_agent(export_dataset_dir=str(tmp_path), num_exploration_steps=50)
+    for _ in range(51):
+        explorer.step_env()
+        explorer.t += 1
+    with pytest.raises(AssertionError):
+        make_agent(load_dataset_dir=str(tmp_path))
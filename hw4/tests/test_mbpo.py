@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+import torch
+
+from rob831.hw4_part1.agents.mb_agent import MBAgent
+from rob831.hw4_part1.agents.sac_agent import SACAgent
+from rob831.hw4_part1.envs.obstacles.obstacles_env import Obstacles
+from rob831.hw4_part1.infrastructure import pytorch_util as ptu
+from rob831.hw4_part1.infrastructure import utils
+from rob831.hw4_part1.scripts.run_hw4_mbpo import MBPO_Trainer
+
+
+class RandomPolicy(object):
+    def __init__(self, env):
+        self.env = env
+
+    def get_action(self, obs):
+        return self.env.action_space.sample()[None]
+
+
+class DriftEnv(object):
+    """1-D walk that terminates once it leaves [-1, 1]"""
+
+    def reset(self):
+        self.state = np.zeros(2, dtype=np.float32)
+        return self.state.copy()
+
+    def step(self, action):
+        self.state = self.state + action
+        return self.state.copy(), 0.0, bool(abs(self.state[0]) > 1), {}
+
+
+class ScaledModel(object):
+    def __init__(self, scale):
+        self.scale = scale
+
+    def get_prediction(self, obs, acs, data_statistics):
+        return obs + self.scale * acs
+
+
+def collect_paths(env, num_steps):
+    paths, _ = utils.sample_trajectories(env, RandomPolicy(env), num_steps, max_path_length=20)
+    return paths
+
+
+def test_running_mean_std_matches_numpy():
+    data = np.random.randn(1000, 3) * [1., 10., 100.] + [5., -5., 0.]
+    stats = utils.RunningMeanStd(3)
+    for chunk in np.array_split(data, [1, 7, 300, 301, 999]):
+        stats.update(chunk)
+    assert stats.count == len(data)
+    assert np.allclose(stats.mean, data.mean(axis=0))
+    assert np.allclose(stats.std, data.std(axis=0))
+
+
+def test_prediction_error_curves_match_per_sequence_rollouts():
+    env = DriftEnv()
+    action_sequences = np.random.uniform(-0.5, 0.5, size=(16, 8, 2)).astype(np.float32)
+    models = [ScaledModel(0.5), ScaledModel(1.5)]
+    errors, true_states, pred_states, valid = utils.calculate_prediction_error_curves(
+        env, action_sequences, models, data_statistics=None)
+    assert not valid.all()
+
+    squared_errors = np.zeros((len(models), 8))
+    counts = np.zeros(8)
+    for i, actions in enumerate(action_sequences):
+        path = utils.perform_actions(env, actions)
+        states = np.concatenate([path['observation'][:1], path['next_observation']])
+        counts[:len(states) - 1] += 1
+        for m, model in enumerate(models):
+            pred = states[0]
+            for t in range(len(states) - 1):
+                pred = model.get_prediction(pred, actions[t], None)
+                squared_errors[m, t] += np.mean((pred - states[t + 1]) ** 2)
+    assert np.allclose(errors, squared_errors / counts, atol=1e-5)
+
+
+def test_mb_agent_trains_each_model_on_its_own_slice():
+    ptu.init_gpu(use_gpu=False)
+    env = Obstacles()
+    agent = MBAgent(env, {
+        'ensemble_size': 3, 'n_layers': 1, 'size': 16, 'learning_rate': 1e-3,
+        'ob_dim': 4, 'ac_dim': 2, 'mpc_horizon': 5, 'mpc_num_action_sequences': 10,
+        'mpc_action_sampling_strategy': 'random', 'cem_iterations': 2,
+        'cem_num_elites': 5, 'cem_alpha': 1,
+    })
+    agent.add_to_replay_buffer(collect_paths(env, 200))
+
+    updates = []
+    for model in agent.dyn_models:
+        def update(observations, actions, next_observations, data_statistics, model=model):
+            updates.append((model, observations))
+            return {'Training Loss': float(len(updates))}
+        model.update = update
+
+    ob_no, ac_na, re_n, next_ob_no, terminal_n = agent.sample(batch_size=10)
+    log = agent.train(ob_no, ac_na, re_n, next_ob_no, terminal_n)
+
+    assert [model for model, _ in updates] == agent.dyn_models
+    for i, (_, observations) in enumerate(updates):
+        assert np.array_equal(observations, ob_no[i * 10:(i + 1) * 10])
+    assert log['Training Loss'] == 2.
+
+
+def test_sac_agent_takes_utd_ratio_critic_steps_on_a_redq_ensemble():
+    ptu.init_gpu(use_gpu=False)
+    env = Obstacles()
+    agent = SACAgent(env, {
+        'gamma': 0.99, 'learning_rate': 3e-4, 'ob_dim': 4, 'ac_dim': 2, 'discrete': False,
+        'n_layers': 2, 'size': 16, 'init_temperature': 1.0, 'n_critics': 5,
+        'actor_update_frequency': 1, 'critic_target_update_frequency': 1, 'utd_ratio': 3,
+        'num_critic_updates_per_agent_update': 1, 'num_actor_updates_per_agent_update': 1,
+    })
+    agent.add_to_replay_buffer(collect_paths(env, 200))
+    target_before = [param.clone() for param in agent.critic_target.parameters()]
+
+    batch = agent.sample(32)
+    assert batch[0].shape == (3 * 32, 4)
+    log = agent.train(*batch)
+
+    assert agent.critic_step == 3 and agent.training_step == 1
+    assert agent.critic(ptu.from_numpy(batch[0]), ptu.from_numpy(batch[1])).shape == (5, 3 * 32)
+    assert set(log) == {'Critic_Loss', 'Actor_Loss', 'Alpha_Loss', 'Temperature'}
+    assert not all(torch.equal(before, after) for before, after in zip(target_before, agent.critic_target.parameters()))
+
+
+def make_mbpo_trainer(logdir):
+    params = {
+        'env_name': 'obstacles-hw4_part1-v0', 'ep_len': 20, 'n_iter': 2, 'eval_batch_size': 40,
+        'seed': 1, 'no_gpu': True, 'which_gpu': 0, 'video_log_freq': -1, 'scalar_log_freq': -1,
+        'save_params': False, 'logdir': str(logdir),
+        'train_batch_size': 32, 'ensemble_size': 3, 'mpc_horizon': 5, 'mpc_num_action_sequences': 10,
+        'mpc_action_sampling_strategy': 'random', 'cem_iterations': 2, 'cem_num_elites': 5,
+        'cem_alpha': 1, 'add_sl_noise': True, 'num_agent_train_steps_per_iter': 5,
+        'batch_size_initial': 200, 'batch_size': 100, 'learning_rate': 1e-3, 'n_layers': 1, 'size': 16,
+        'sac_num_agent_train_steps_per_iter': 2, 'sac_num_critic_updates_per_agent_update': 1,
+        'sac_num_actor_updates_per_agent_update': 1, 'sac_utd_ratio': 2,
+        'sac_actor_update_frequency': 1, 'sac_critic_target_update_frequency': 1,
+        'sac_train_batch_size': 32, 'sac_batch_size': 100, 'sac_discount': 0.99,
+        'sac_init_temperature': 1.0, 'sac_learning_rate': 3e-4, 'sac_n_layers': 2, 'sac_size': 16,
+        'sac_n_iter': 4, 'sac_n_critics': 4, 'mbpo_rollout_length': 3, 'mbpo_rollout_batch_size': None,
+        'mbpo_ensemble_mode': 'random', 'mbpo_model_buffer_size': 1000,
+        'mbpo_model_retain_generations': 1, 'mbpo_real_ratio': 0.5,
+    }
+    return MBPO_Trainer(params)
+
+
+def test_mbpo_training_loop_runs(tmp_path):
+    trainer = make_mbpo_trainer(tmp_path)
+    trainer.run_training_loop()
+    agent = trainer.rl_trainer.agent
+    assert 0 < len(agent.model_replay_buffer) <= 4 * 3
+    assert agent.sac_agent.training_step == 2 * 4 * 2
+
+
+def test_plot_errors_are_raised_by_finish_plots(tmp_path):
+    rl_trainer = make_mbpo_trainer(tmp_path).rl_trainer
+
+    def fail():
+        raise ValueError('plot failed')
+
+    rl_trainer.submit_plot(fail)
+    with pytest.raises(ValueError, match='plot failed'):
+        rl_trainer.finish_plots()
+    assert rl_trainer.plot_executor is None
+    rl_trainer.finish_plots()
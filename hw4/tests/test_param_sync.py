@@ -0,0 +1,33 @@
+import pytest
+import torch
+from torch import nn
+
+from rob831.hw4_part2.infrastructure.param_sync import hard_update, soft_update
+
+
+@pytest.fixture(params=['foreach_copy', 'fallback'])
+def copy_impl(request, monkeypatch):
+    if request.param == 'fallback':
+        monkeypatch.delattr(torch, '_foreach_copy_', raising=False)
+    return request.param
+
+
+def test_hard_update_replaces_nan_and_inf_in_the_target(copy_impl):
+    net, target_net = nn.Linear(3, 2), nn.Linear(3, 2)
+    with torch.no_grad():
+        target_net.weight[0, 0] = float('nan')
+        target_net.bias[1] = float('inf')
+
+    hard_update(target_net, net)
+    for target, source in zip(target_net.parameters(), net.parameters()):
+        assert torch.equal(target, source)
+
+
+def test_soft_update_is_polyak_averaging():
+    net, target_net = nn.Linear(3, 2), nn.Linear(3, 2)
+    expected = [0.9 * target + 0.1 * source
+                for target, source in zip(target_net.parameters(), net.parameters())]
+
+    soft_update(target_net, net, 0.1)
+    for target, value in zip(target_net.parameters(), expected):
+        assert torch.allclose(target, value)